@@ -5,10 +5,56 @@ from pydantic import BaseSettings
 
 load_dotenv()
 
+ENVIRONMENT = os.getenv("ENVIRONMENT", "local")
+
+DB_PROFILES = {
+    "local": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 30,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+        "statement_cache_size": 100,
+        "statement_timeout_ms": 0,
+    },
+    "production": {
+        "echo": False,
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_cache_size": 500,
+        "statement_timeout_ms": 15000,
+    },
+}
+DB_PROFILE = os.getenv(
+    "DB_PROFILE",
+    "local" if ENVIRONMENT == "local" else "production",
+)
+
+
+def get_db_setting(name: str):
+    """Environment DB_<NAME> overrides the value of the active profile."""
+    default = DB_PROFILES[DB_PROFILE][name]
+    value = os.getenv(f"DB_{name.upper()}")
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+
+    return type(default)(value)
+
 
 class Settings(BaseSettings):
-    databases = {"url": os.getenv("DB_URL")}
-    environment = os.getenv("ENVIRONMENT", "local")
+    databases = {
+        "url": os.getenv("DB_URL"),
+        "profile": DB_PROFILE,
+        **{name: get_db_setting(name) for name in DB_PROFILES[DB_PROFILE]},
+    }
+    environment = ENVIRONMENT
+    log_level = os.getenv("LOG_LEVEL", "INFO")
     tokens = {
         "access_token": {
             "secret_key": os.getenv("ACCESS_SECRET_KEY"),
@@ -25,6 +71,60 @@ class Settings(BaseSettings):
         },
         "algorithm": os.getenv("ALGORITHM", "HS256"),
     }
+    paginations = {
+        "default_limit": int(os.getenv("PAGINATION_DEFAULT_LIMIT", 20)),
+        "max_limit": int(os.getenv("PAGINATION_MAX_LIMIT", 100)),
+    }
+    broadcasts = {"url": os.getenv("BROADCAST_URL", "memory://")}
+    websockets = {
+        "send_queue_size": int(os.getenv("WS_SEND_QUEUE_SIZE", 100)),
+        "send_timeout_secs": float(os.getenv("WS_SEND_TIMEOUT_SECS", 5)),
+        "max_chats": int(os.getenv("WS_MAX_CHATS", 200)),
+        "max_replay": int(os.getenv("WS_MAX_REPLAY", 500)),
+    }
+    serializers = {
+        "fast_json": os.getenv("FAST_JSON", "false").lower() == "true",
+    }
+    passwords = {
+        "workers": int(os.getenv("PASSWORD_WORKERS", 2)),
+        "max_pending": int(os.getenv("PASSWORD_MAX_PENDING", 32)),
+    }
+    caches = {
+        "broadcast_url": os.getenv("CACHE_BROADCAST_URL"),
+        "users": {
+            "max_size": int(os.getenv("USER_CACHE_MAX_SIZE", 10000)),
+            "ttl_secs": int(os.getenv("USER_CACHE_TTL_SECS", 60)),
+        },
+        "tokens": {
+            "max_size": int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000)),
+        },
+    }
+    messages = {
+        "batch_size": int(os.getenv("MESSAGE_BATCH_SIZE", 200)),
+        "batch_delay_ms": int(os.getenv("MESSAGE_BATCH_DELAY_MS", 5)),
+        "chat_preview_size": int(os.getenv("CHAT_PREVIEW_SIZE", 20)),
+    }
+    exports = {"batch_size": int(os.getenv("EXPORT_BATCH_SIZE", 1000))}
+    metrics = {
+        "enabled": os.getenv("METRICS_ENABLED", "false").lower() == "true",
+        "query_threshold": int(os.getenv("METRICS_QUERY_THRESHOLD", 20)),
+        "top_chats": int(os.getenv("METRICS_TOP_CHATS", 10)),
+        "loop_lag_interval_secs": float(
+            os.getenv("METRICS_LOOP_LAG_INTERVAL_SECS", 0.5)
+        ),
+    }
+    presences = {
+        "debounce_ms": int(os.getenv("PRESENCE_DEBOUNCE_MS", 200)),
+        "min_interval_ms": int(os.getenv("PRESENCE_MIN_INTERVAL_MS", 1000)),
+        "typing_ttl_secs": float(os.getenv("PRESENCE_TYPING_TTL_SECS", 5)),
+    }
+    tweets = {"bulk_max_size": int(os.getenv("TWEET_BULK_MAX_SIZE", 5000))}
+    timelines = {
+        "max_length": int(os.getenv("TIMELINE_MAX_LENGTH", 800)),
+        "max_cached": int(os.getenv("TIMELINE_MAX_CACHED", 10000)),
+        "ttl_secs": int(os.getenv("TIMELINE_TTL_SECS", 60)),
+        "fan_out_limit": int(os.getenv("TIMELINE_FAN_OUT_LIMIT", 5000)),
+    }
 
     class Config:
         env_file = ".env"
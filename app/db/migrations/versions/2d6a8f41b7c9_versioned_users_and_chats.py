@@ -0,0 +1,28 @@
+"""versioned users and chats
+
+Revision ID: 2d6a8f41b7c9
+Revises: 9e07b3c5a4d1
+Create Date: 2026-10-17 12:40:09.617382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d6a8f41b7c9'
+down_revision = '9e07b3c5a4d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('chat', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "user" SET updated_at = created_at')
+    op.execute('UPDATE chat SET updated_at = created_at')
+
+
+def downgrade() -> None:
+    op.drop_column('chat', 'updated_at')
+    op.drop_column('user', 'updated_at')
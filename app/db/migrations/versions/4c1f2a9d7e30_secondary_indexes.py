@@ -0,0 +1,49 @@
+"""secondary indexes
+
+Revision ID: 4c1f2a9d7e30
+Revises: 8b98fe1cfe39
+Create Date: 2026-10-17 10:03:18.554920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1f2a9d7e30'
+down_revision = '8b98fe1cfe39'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction, each index is
+# built in an autocommit block so the migration can run on a live database.
+INDEXES = [
+    ('ix_message_chat_id_id', 'message', ['chat_id', sa.text('id DESC')]),
+    ('ix_message_owner_id', 'message', ['owner_id']),
+    ('ix_tweet_by_id_id', 'tweet', ['by_id', sa.text('id DESC')]),
+    ('ix_chat_user_participant_participant_id', 'chat_user_participant', ['participant_id']),
+    ('ix_chat_user_admin_admin_id', 'chat_user_admin', ['admin_id']),
+    ('ix_user_message_read_message_id', 'user_message_read', ['message_id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+            )
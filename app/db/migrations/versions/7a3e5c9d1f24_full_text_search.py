@@ -0,0 +1,46 @@
+"""full text search
+
+Revision ID: 7a3e5c9d1f24
+Revises: 2d6a8f41b7c9
+Create Date: 2026-10-17 22:31:47.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3e5c9d1f24'
+down_revision = '2d6a8f41b7c9'
+branch_labels = None
+depends_on = None
+
+# The expressions must match the queries of utils/searches.py for the
+# planner to use the indexes. Built concurrently, see 4c1f2a9d7e30.
+INDEXES = [
+    ('ix_tweet_content_tsv', 'tweet'),
+    ('ix_message_content_tsv', 'message'),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(
+                name,
+                table,
+                [sa.text("to_tsvector('simple', content)")],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+            )
@@ -0,0 +1,34 @@
+"""user follow
+
+Revision ID: 8b98fe1cfe39
+Revises: d3ea7dab1d58
+Create Date: 2026-10-17 09:12:41.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b98fe1cfe39'
+down_revision = 'd3ea7dab1d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('user_follow',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followed_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['followed_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('follower_id', 'followed_id')
+    )
+    op.create_index(op.f('ix_user_follow_followed_id'), 'user_follow', ['followed_id'], unique=False)
+    op.add_column('user', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'followers_count')
+    op.drop_index(op.f('ix_user_follow_followed_id'), table_name='user_follow')
+    op.drop_table('user_follow')
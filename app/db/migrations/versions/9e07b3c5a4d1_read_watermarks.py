@@ -0,0 +1,49 @@
+"""read watermarks
+
+Revision ID: 9e07b3c5a4d1
+Revises: 4c1f2a9d7e30
+Create Date: 2026-10-17 11:26:47.031245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e07b3c5a4d1'
+down_revision = '4c1f2a9d7e30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_user_participant', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+    # Backfill each participant watermark with its newest read message
+    op.execute(
+        """
+        UPDATE chat_user_participant AS p
+        SET last_read_message_id = r.message_id
+        FROM (
+            SELECT m.chat_id, umr.user_id, MAX(m.id) AS message_id
+            FROM user_message_read AS umr
+            JOIN message AS m ON m.id = umr.message_id
+            GROUP BY m.chat_id, umr.user_id
+        ) AS r
+        WHERE p.chat_id = r.chat_id AND p.participant_id = r.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    # Restore per message rows for every message under the watermark
+    op.execute(
+        """
+        INSERT INTO user_message_read (user_id, message_id)
+        SELECT p.participant_id, m.id
+        FROM chat_user_participant AS p
+        JOIN message AS m
+            ON m.chat_id = p.chat_id AND m.id <= p.last_read_message_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.drop_column('chat_user_participant', 'last_read_message_id')
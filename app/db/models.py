@@ -4,6 +4,7 @@ from models.chats import Chat, Message
 from models.associations import (
     ChatUserAdmin,
     ChatUserParticipant,
+    UserFollow,
     UserMessageRead,
 )
 from models.tweets import Tweet
@@ -1,18 +1,69 @@
+import logging
+
 # from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from config.settings import settings
 
+logger = logging.getLogger(__name__)
+
 DB_URL = settings.databases["url"]
 
 if DB_URL is None:
     raise Exception("No DB_URL defined")
 
+
+def get_engine_options() -> dict:
+    db_settings = settings.databases
+    options = {"echo": db_settings["echo"]}
+
+    if DB_URL.startswith("sqlite"):
+        return options
+
+    options.update(
+        pool_size=db_settings["pool_size"],
+        max_overflow=db_settings["max_overflow"],
+        pool_timeout=db_settings["pool_timeout"],
+        pool_recycle=db_settings["pool_recycle"],
+        pool_pre_ping=db_settings["pool_pre_ping"],
+    )
+
+    if DB_URL.startswith("postgresql+asyncpg"):
+        server_settings = {}
+        if db_settings["statement_timeout_ms"]:
+            server_settings["statement_timeout"] = str(
+                db_settings["statement_timeout_ms"]
+            )
+
+        options["connect_args"] = {
+            "prepared_statement_cache_size": db_settings[
+                "statement_cache_size"
+            ],
+            "server_settings": server_settings,
+        }
+
+    return options
+
+
+def log_engine_config():
+    options = get_engine_options()
+    options.pop("connect_args", None)
+    logger.info(
+        "Database engine %s with profile %s: %s, statement_cache_size=%s, "
+        "statement_timeout_ms=%s",
+        engine.url.render_as_string(hide_password=True),
+        settings.databases["profile"],
+        ", ".join(f"{k}={v}" for k, v in options.items()),
+        settings.databases["statement_cache_size"],
+        settings.databases["statement_timeout_ms"],
+    )
+
+
 # engine = create_engine(url=DB_URL)
 # SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-engine = create_async_engine(url=DB_URL, echo=True)
+engine = create_async_engine(url=DB_URL, **get_engine_options())
 async_session = sessionmaker(
     bind=engine,
     expire_on_commit=False,
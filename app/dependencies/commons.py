@@ -1,14 +1,17 @@
 from typing import Annotated
 
-from fastapi import Depends
+from fastapi import Depends, Query
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config.settings import settings
 from db.session import async_session
-from services.users import UserService
+from services.users import UserService, user_cache
+from schemas.paginations import PaginationSchema, SearchSchema
 from schemas.users import UserSchema
 
 from libs.jwt import decode_token
+from utils.paginations import decode_cursor, decode_search_cursor
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="api/v1/auths/login")
 service = UserService()
@@ -32,4 +35,42 @@ async def get_current_user(
     db: Annotated[AsyncSession, Depends(get_session)],
 ) -> UserSchema:
     acc_tok_data = decode_token(token=access_token)
-    return await service.find_one_by_id(db=db, id=acc_tok_data.user_id)
+
+    user = user_cache.get(acc_tok_data.user_id)
+    if user is None:
+        user = UserSchema.from_orm(
+            await service.find_one_by_id(db=db, id=acc_tok_data.user_id)
+        )
+        user_cache.set(acc_tok_data.user_id, user)
+
+    return user
+
+
+def get_pagination(
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1)] = settings.paginations[
+        "default_limit"
+    ],
+) -> PaginationSchema:
+    return PaginationSchema(
+        before_id=decode_cursor(cursor) if cursor is not None else None,
+        limit=min(limit, settings.paginations["max_limit"]),
+    )
+
+
+def get_search(
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1)] = settings.paginations[
+        "default_limit"
+    ],
+) -> SearchSchema:
+    before_rank, before_id = (
+        decode_search_cursor(cursor) if cursor is not None else (None, None)
+    )
+    return SearchSchema(
+        query=q,
+        before_rank=before_rank,
+        before_id=before_id,
+        limit=min(limit, settings.paginations["max_limit"]),
+    )
@@ -1,3 +1,4 @@
+import hashlib
 from datetime import datetime, timedelta
 
 from fastapi import HTTPException, status
@@ -10,6 +11,7 @@ from schemas.auths import (
 )
 
 from config.settings import settings
+from utils.caches import TTLCache
 
 at_secr_key = settings.tokens["access_token"]["secret_key"]
 at_exp_mins = settings.tokens["access_token"]["expires_mins"]
@@ -17,6 +19,36 @@ rt_secr_key = settings.tokens["refresh_token"]["secret_key"]
 rt_exp_mins = settings.tokens["refresh_token"]["expires_mins"]
 alg = settings.tokens["algorithm"]
 
+# Decoded tokens are cached until their own expiration
+token_cache = TTLCache(
+    max_size=settings.caches["tokens"]["max_size"],
+    ttl=max(at_exp_mins, rt_exp_mins) * 60,
+)
+
+
+def _token_cache_key(token: str, secret_key: str) -> str:
+    # The secret is part of the key, a rotated secret never hits old entries
+    return hashlib.sha256(f"{alg}:{secret_key}:{token}".encode()).hexdigest()
+
+
+def _cache_token_data(
+    cache_key: str,
+    decoded_token: dict,
+    expiration_time: datetime,
+) -> TokenDataSchema:
+    token_data = TokenDataSchema(**decoded_token)
+    ttl = (expiration_time - datetime.utcnow()).total_seconds()
+    token_cache.set(cache_key, token_data, ttl=ttl)
+    return token_data
+
+
+def get_token_cache_stats() -> dict:
+    return {
+        "size": len(token_cache.entries),
+        "hits": token_cache.hits,
+        "misses": token_cache.misses,
+    }
+
 
 def create_access_token(user_id: int) -> AccessTokenSchema:
     expires_in = datetime.utcnow() + timedelta(minutes=at_exp_mins)
@@ -42,10 +74,16 @@ def decode_token(
     token: str,
     is_refresh_token: bool = False,
 ) -> TokenDataSchema | None:
+    secret_key = rt_secr_key if is_refresh_token else at_secr_key
+    cache_key = _token_cache_key(token=token, secret_key=secret_key)
+    token_data = token_cache.get(cache_key)
+    if token_data is not None:
+        return token_data
+
     try:
         decoded_token = decode(
             jwt=token,
-            key=rt_secr_key if is_refresh_token else at_secr_key,
+            key=secret_key,
             algorithms=[alg],
         )
     except:
@@ -62,27 +100,40 @@ def decode_token(
                 detail="Expired token",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return TokenDataSchema(**decoded_token)
+        return _cache_token_data(
+            cache_key=cache_key,
+            decoded_token=decoded_token,
+            expiration_time=expiration_time,
+        )
 
 
 def decode_token_without_exception(
     token: str,
     is_refresh_token: bool = False,
 ) -> TokenDataSchema | None:
+    secret_key = rt_secr_key if is_refresh_token else at_secr_key
+    cache_key = _token_cache_key(token=token, secret_key=secret_key)
+    token_data = token_cache.get(cache_key)
+    if token_data is not None:
+        return token_data
+
     try:
         decoded_token = decode(
             jwt=token,
-            key=rt_secr_key if is_refresh_token else at_secr_key,
+            key=secret_key,
             algorithms=[alg],
         )
     except:
         return None
     else:
         expiration_time = datetime.fromisoformat(decoded_token["expires"])
-        return (
-            TokenDataSchema(**decoded_token)
-            if expiration_time > datetime.utcnow()
-            else None
+        if expiration_time <= datetime.utcnow():
+            return None
+
+        return _cache_token_data(
+            cache_key=cache_key,
+            decoded_token=decoded_token,
+            expiration_time=expiration_time,
         )
 
 
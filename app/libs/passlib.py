@@ -1,9 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from config.settings import settings
+
+ResultT = TypeVar("ResultT")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def create_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# bcrypt releases the GIL, a small thread pool keeps it off the event loop
+pwd_executor = ThreadPoolExecutor(
+    max_workers=settings.passwords["workers"],
+    thread_name_prefix="passlib",
+)
+pwd_stats = {"pending": 0, "rejected": 0}
+
+PASSWORD_EXCEPTION_503 = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many password operations, try again later",
+    headers={"Retry-After": "1"},
+)
+
+
+async def _run_in_pool(func: Callable[..., ResultT], *args) -> ResultT:
+    if pwd_stats["pending"] >= settings.passwords["max_pending"]:
+        pwd_stats["rejected"] += 1
+        raise PASSWORD_EXCEPTION_503
+
+    pwd_stats["pending"] += 1
+    loop = asyncio.get_running_loop()
+    job = pwd_executor.submit(func, *args)
+    # Released when the job ends, a cancelled request does not stop it
+    job.add_done_callback(
+        lambda _: loop.call_soon_threadsafe(_release_pending)
+    )
+    return await asyncio.wrap_future(job)
+
+
+def _release_pending():
+    pwd_stats["pending"] -= 1
+
+
+def get_password_queue_depth() -> int:
+    return max(pwd_stats["pending"] - settings.passwords["workers"], 0)
+
+
+async def create_password_hash(password: str) -> str:
+    return await _run_in_pool(pwd_context.hash, password)
+
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(pwd_context.verify, password, hashed_password)
@@ -1,18 +1,27 @@
+import logging
+
 import uvicorn
 
 from fastapi import FastAPI
 
 from routers.routes import include_router
 from config.settings import settings
+from db.session import engine, log_engine_config
+from utils.middlewares import include_metrics
 # from utils.middlewares import include_middlewares
 
 """ To init DB automatically """
 # from commons.database.db import Base, engine
 # Base.metadata.create_all(bind=engine)
 
+logging.basicConfig(level=settings.log_level)
+
 app = FastAPI(title="Twitter API", version="0.0.1")
+app.add_event_handler("startup", log_engine_config)
 
 # include_middlewares(app=app)
+if settings.metrics["enabled"]:
+    include_metrics(app=app, engine=engine)
 include_router(app=app)
 
 if __name__ == "__main__":
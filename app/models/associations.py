@@ -7,16 +7,45 @@ class ChatUserParticipant(Base):
     __tablename__ = "chat_user_participant"
 
     chat_id = Column(Integer, ForeignKey("chat.id"), primary_key=True)
-    participant_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    participant_id = Column(
+        Integer,
+        ForeignKey("user.id"),
+        primary_key=True,
+        index=True,
+    )
+    # Every message of the chat with a lower or equal id was read
+    last_read_message_id = Column(Integer, nullable=True)
 
 
 class ChatUserAdmin(Base):
     __tablename__ = "chat_user_admin"
     chat_id = Column(Integer, ForeignKey("chat.id"), primary_key=True)
-    admin_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    admin_id = Column(
+        Integer,
+        ForeignKey("user.id"),
+        primary_key=True,
+        index=True,
+    )
 
 
+# Deprecated, read state lives in ChatUserParticipant.last_read_message_id
 class UserMessageRead(Base):
     __tablename__ = "user_message_read"
     user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
-    message_id = Column(Integer, ForeignKey("message.id"), primary_key=True)
+    message_id = Column(
+        Integer,
+        ForeignKey("message.id"),
+        primary_key=True,
+        index=True,
+    )
+
+
+class UserFollow(Base):
+    __tablename__ = "user_follow"
+    follower_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    followed_id = Column(
+        Integer,
+        ForeignKey("user.id"),
+        primary_key=True,
+        index=True,
+    )
@@ -1,11 +1,20 @@
 import enum
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Column, Enum, ForeignKey, Integer, String
+from sqlalchemy import (
+    Column,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    func,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from db.base import Base
-from .commons import Timestamp
+from .commons import Timestamp, Versioned
 
 if TYPE_CHECKING:
     from .users import User
@@ -21,7 +30,7 @@ class MessageTypes(str, enum.Enum):
     FILE = "file"
 
 
-class Chat(Base, Timestamp):
+class Chat(Base, Timestamp, Versioned):
     __tablename__ = "chat"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -70,7 +79,7 @@ class Message(Base, Timestamp):
     type = Column(Enum(MessageTypes, length=10), default=MessageTypes.TEXT)
     content = Column(String(length=256))
     chat_id = Column(Integer, ForeignKey("chat.id"))
-    owner_id = Column(Integer, ForeignKey("user.id"))
+    owner_id = Column(Integer, ForeignKey("user.id"), index=True)
 
     chat = relationship("Chat", back_populates="messages")
     owner = relationship("User", back_populates="messages")
@@ -79,3 +88,14 @@ class Message(Base, Timestamp):
         secondary="user_message_read",
         back_populates="messages_read",
     )
+
+
+# Messages of a chat, newest first
+Index("ix_message_chat_id_id", Message.chat_id, Message.id.desc())
+
+# Full-text search, other dialects use the in-process index
+Index(
+    "ix_message_content_tsv",
+    func.to_tsvector(text("'simple'"), Message.content),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
@@ -5,3 +5,7 @@ from sqlalchemy import Column, DateTime
 
 class Timestamp:
     created_at = Column(DateTime, default=datetime.now)
+
+
+class Versioned:
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
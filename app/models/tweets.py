@@ -1,6 +1,15 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    func,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from db.base import Base
@@ -16,3 +25,14 @@ class Tweet(Base, Timestamp):
     by_id = Column(Integer, ForeignKey("user.id"))
 
     by = relationship("User", back_populates="tweets")
+
+
+# Tweets of a user, newest first
+Index("ix_tweet_by_id_id", Tweet.by_id, Tweet.id.desc())
+
+# Full-text search, other dialects use the in-process index
+Index(
+    "ix_tweet_content_tsv",
+    func.to_tsvector(text("'simple'"), Tweet.content),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
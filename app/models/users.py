@@ -4,7 +4,7 @@ from sqlalchemy import Column, Date, Integer, String
 from sqlalchemy.orm import relationship
 
 from db.base import Base
-from .commons import Timestamp
+from .commons import Timestamp, Versioned
 
 if TYPE_CHECKING:
     from .tweets import Tweet
@@ -14,7 +14,7 @@ if TYPE_CHECKING:
     from .associations import ChatUserParticipant
 
 
-class User(Base, Timestamp):
+class User(Base, Timestamp, Versioned):
     __tablename__ = "user"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -23,6 +23,7 @@ class User(Base, Timestamp):
     first_name = Column(String(length=50))
     last_name = Column(String(length=50))
     birth_date = Column(Date, nullable=True)
+    followers_count = Column(Integer, default=0, server_default="0")
 
     tweets = relationship("Tweet", back_populates="by")
     messages = relationship("Message", back_populates="owner")
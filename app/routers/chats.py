@@ -1,104 +1,321 @@
 from datetime import datetime
 import json
-from typing import Annotated, List
+from typing import Annotated, Dict, List
 
 from fastapi import (
     APIRouter,
     Depends,
     Header,
+    Request,
+    Response,
     status,
     WebSocket,
     WebSocketDisconnect,
     WebSocketException,
 )
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config.settings import settings
+from db.session import async_session
 from schemas.chats import (
     ChatAddAdminsSchema,
     ChatAddParticipantsSchema,
-    ChatAllSchema,
+    ChatDetailSchema,
+    ChatReadSchema,
     ChatSchema,
     ChatCreateSchema,
+    ChatUnreadSchema,
     ChatUpdateSchema,
     MessageCreateSchema,
+    MessageSchema,
 )
+from schemas.paginations import PageSchema, PaginationSchema, SearchSchema
+from schemas.users import UserSchema
 from services.chats import ChatService
+from services.messages import MessageBatchWriter
 
-from dependencies.commons import get_current_user, get_session
+from dependencies.commons import (
+    get_current_user,
+    get_pagination,
+    get_search,
+    get_session,
+)
 from libs.jwt import (
     decode_token_without_exception,
     get_authorization_header_token,
 )
 from utils.chats import ChatManager
 from utils.commons import Tags
-
-from db import models
+from utils.etags import is_not_modified, not_modified_response
+from utils.exports import MEDIA_TYPES, ExportFormats, encode_export
+from utils.presences import PresenceService
 
 router = APIRouter(prefix="/chats", tags=[Tags.chats.value])
 service = ChatService()
 manager = ChatManager()
+presence = PresenceService(manager=manager)
+message_writer = MessageBatchWriter()
+
+
+@router.on_event("startup")
+async def startup_chat_manager():
+    await manager.startup()
+    await message_writer.startup()
+
+
+@router.on_event("shutdown")
+async def shutdown_chat_manager():
+    await message_writer.shutdown()
+    await presence.shutdown()
+    await manager.shutdown()
 
 
 @router.get(
     path="/",
-    response_model=List[ChatSchema],
+    response_model=PageSchema[ChatSchema],
     status_code=status.HTTP_200_OK,
     summary="Get all chats",
     dependencies=[Depends(get_current_user)],
 )
-async def get_all_chats(db: Annotated[AsyncSession, Depends(get_session)]):
+async def get_all_chats(
+    request: Request,
+    response: Response,
+    pagination: Annotated[PaginationSchema, Depends(get_pagination)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
     """
     Get chats
 
-    This path operation get all chats in the app.
+    This path operation get a page of chats in the app, newest first. It
+    answers 304 without a body when the If-None-Match header matches the
+    page ETag.
 
-    Returns a json list with the chat model
-    - id: int
-    - type: simple | group
-    - logo: str | None
-    - title: str
-    - participants: List[User]
-    - admins: List[User]
+    Parameters
+    - Query parameter
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Chat]
+    - next_cursor: str | None
     """
-    return await service.find_all_chats(db=db)
+    etag = await service.find_all_chats_etag(pagination=pagination, db=db)
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag)
+
+    response.headers["ETag"] = etag
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(
+            await service.find_all_chats(
+                pagination=pagination,
+                db=db,
+                fast=True,
+            ),
+            headers={"ETag": etag},
+        )
+
+    return await service.find_all_chats(pagination=pagination, db=db)
+
+
+@router.get(
+    path="/unread",
+    response_model=List[ChatUnreadSchema],
+    status_code=status.HTTP_200_OK,
+    summary="Get unread counts",
+)
+async def get_unread_counts(
+    user: Annotated[UserSchema, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Get unread counts
+
+    This path operation get the unread messages count of every chat of the
+    current user in the app.
+
+    Returns a json list with the unread model
+    - chat_id: int
+    - last_read_message_id: int | None
+    - unread_count: int
+    """
+    return await service.find_unread_counts(user_id=user.id, db=db)
 
 
 @router.get(
     path="/{chat_id}",
-    response_model=ChatAllSchema,
+    response_model=ChatDetailSchema,
     status_code=status.HTTP_200_OK,
     summary="Get chat",
     dependencies=[Depends(get_current_user)],
 )
 async def get_chat(
-    chat_id: int, db: Annotated[AsyncSession, Depends(get_session)]
+    chat_id: int,
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_session)],
 ):
     """
     Get chat
 
-    This path operation get a chat in the app.
+    This path operation get a chat in the app, with its newest messages.
+    Older messages are loaded from the chat messages path operation. It
+    answers 304 without a body when the If-None-Match header matches the
+    chat ETag.
 
     Parameters
     - Path parameter
         - chat_id: int
 
-    Returns a json list with the chat model
+    Returns a json with the chat model
     - id: int
     - type: simple | group
     - logo: str | None
     - title: str
-    - participants: List[User]
-    - admins: List[User]
+    - participants_count: int
     - messages: List[Message]
+    - messages_next_cursor: str | None
     """
-    return await service.find_one_chat_by_id(
-        id=chat_id,
+    etag = await service.find_chat_etag(id=chat_id, db=db)
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag)
+
+    response.headers["ETag"] = etag
+    return await service.find_chat_detail(id=chat_id, db=db)
+
+
+@router.get(
+    path="/{chat_id}/messages",
+    response_model=PageSchema[MessageSchema],
+    status_code=status.HTTP_200_OK,
+    summary="Get chat messages",
+    dependencies=[Depends(get_current_user)],
+)
+async def get_chat_messages(
+    chat_id: int,
+    pagination: Annotated[PaginationSchema, Depends(get_pagination)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Get chat messages
+
+    This path operation get a page of messages of a chat in the app, newest
+    first. Pass the returned cursor to scroll back in the history.
+
+    Parameters
+    - Path parameter
+        - chat_id: int
+    - Query parameter
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Message]
+    - next_cursor: str | None
+    """
+    await service.find_one_chat_by_id(id=chat_id, db=db)
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(
+            await service.find_all_messages(
+                pagination=pagination,
+                db=db,
+                chat_id=chat_id,
+                fast=True,
+            )
+        )
+
+    return await service.find_all_messages(
+        pagination=pagination,
         db=db,
-        model_props_relation=[
-            models.Chat.admins,
-            models.Chat.participants,
-            models.Chat.messages,
-        ],
+        chat_id=chat_id,
+    )
+
+
+@router.get(
+    path="/{chat_id}/messages/search",
+    response_model=PageSchema[MessageSchema],
+    status_code=status.HTTP_200_OK,
+    summary="Search chat messages",
+    dependencies=[Depends(get_current_user)],
+)
+async def search_chat_messages(
+    chat_id: int,
+    search: Annotated[SearchSchema, Depends(get_search)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Search chat messages
+
+    This path operation get a page of the messages of a chat in the app
+    matching a full-text query, best match first.
+
+    Parameters
+    - Path parameter
+        - chat_id: int
+    - Query parameter
+        - q: str
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Message]
+    - next_cursor: str | None
+    """
+    await service.find_one_chat_by_id(id=chat_id, db=db)
+    page = await service.search_messages(chat_id=chat_id, search=search, db=db)
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(page)
+
+    return page
+
+
+@router.get(
+    path="/{chat_id}/messages/export",
+    status_code=status.HTTP_200_OK,
+    summary="Export chat messages",
+    dependencies=[Depends(get_current_user)],
+)
+async def export_chat_messages(
+    chat_id: int,
+    db: Annotated[AsyncSession, Depends(get_session)],
+    format: ExportFormats = ExportFormats.ndjson,
+    after_id: int | None = None,
+):
+    """
+    Export chat messages
+
+    This path operation stream the messages of a chat in the app as NDJSON
+    or CSV, oldest first. Rows are written as they are read, pass the last
+    received id as after_id to resume an interrupted export.
+
+    Parameters
+    - Path parameter
+        - chat_id: int
+    - Query parameter
+        - format: ndjson | csv
+        - after_id: int | None
+
+    Returns a stream of the message model
+    - type: text | file
+    - content: str
+    - chat_id: int
+    - owner_id: int
+    - id: int
+    - readed_by: List[int]
+    """
+    await service.find_one_chat_by_id(id=chat_id, db=db)
+    batches = service.export_messages(
+        chat_id=chat_id,
+        db=db,
+        after_id=after_id,
+    )
+    return StreamingResponse(
+        encode_export(
+            batches=batches,
+            export_format=format,
+            fields=list(MessageSchema.__fields__),
+        ),
+        media_type=MEDIA_TYPES[format],
     )
 
 
@@ -194,6 +411,42 @@ async def delete_chat(
     return await service.remove_chat(id=chat_id, db=db)
 
 
+@router.post(
+    path="/{chat_id}/read",
+    status_code=status.HTTP_200_OK,
+    summary="Mark chat as read",
+)
+async def mark_chat_as_read(
+    chat_id: int,
+    read: ChatReadSchema,
+    user: Annotated[UserSchema, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+) -> dict:
+    """
+    Mark chat as read
+
+    This path operation mark the messages of a chat as read by the current
+    user up to a message in the app.
+
+    Parameters
+        - Path parameter
+            - chat_id: int
+        - Request body parameter
+            - read: ChatRead
+
+    Returns a json with the chat id, message id and success property
+    - chat_id: int
+    - message_id: int
+    - success: bool
+    """
+    return await service.mark_chat_as_read(
+        id=chat_id,
+        user_id=user.id,
+        message_id=read.message_id,
+        db=db,
+    )
+
+
 @router.post(
     path="/chat/{chat_id}/participants",
     status_code=status.HTTP_200_OK,
@@ -266,12 +519,261 @@ async def remove_admins(
     )
 
 
+def _message_payload(message) -> str:
+    return json.dumps(
+        {
+            "event": "message",
+            "id": message.id,
+            "time": message.created_at.strftime("%H:%M:%S"),
+            "chatId": message.chat_id,
+            "userId": message.owner_id,
+            "message": message.content,
+            "type": message.type,
+        }
+    )
+
+
+async def _send_event(websocket: WebSocket, event: str, **data):
+    await manager.send_personal_message(
+        websocket=websocket,
+        message=json.dumps({"event": event, **data}),
+    )
+
+
+async def _replay(websocket: WebSocket, chat_id: int, since_id: int):
+    """
+    Send the messages of a chat joined paused that are newer than
+    `since_id`, then resume live delivery from the last one sent.
+
+    The replay is capped by `max_replay`, a "replayed" event with
+    `complete` false tells the client to page the rest over HTTP. It is
+    sent in chunks of half the send queue, waiting for each to be written,
+    so `max_replay` may exceed `send_queue_size`.
+    """
+    after_id = since_id
+    try:
+        limit = settings.websockets["max_replay"]
+        async with async_session() as db:
+            messages = await service.find_messages_since(
+                chat_id=chat_id, since_id=since_id, limit=limit + 1, db=db
+            )
+
+        replayed = messages[:limit]
+        if replayed:
+            after_id = replayed[-1].id
+            await manager.send_personal_messages(
+                websocket=websocket,
+                messages=map(_message_payload, replayed),
+            )
+
+        await _send_event(
+            websocket,
+            "replayed",
+            chatId=chat_id,
+            count=min(len(messages), limit),
+            complete=len(messages) <= limit,
+        )
+    finally:
+        await manager.resume(
+            websocket=websocket, chat_id=chat_id, after_id=after_id
+        )
+
+
+def _since_messages_id(data: dict) -> Dict[int, int] | None:
+    since_messages_id = data.get("sinceMessageIds", {})
+    if not isinstance(since_messages_id, dict):
+        return None
+
+    try:
+        return {
+            int(chat_id): int(since_id)
+            for chat_id, since_id in since_messages_id.items()
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+def _chats_id(data: dict) -> List[int] | None:
+    chats_id = data.get("chatIds")
+    if not isinstance(chats_id, list) or not all(
+        type(chat_id) is int for chat_id in chats_id
+    ):
+        return None
+
+    return chats_id
+
+
+# Declared before /{chat_id} so "ws" is not read as a chat id
+@router.websocket(path="/ws")
+async def ws_chats(
+    websocket: WebSocket,
+    authorization: str = Header(...),
+):
+    token = get_authorization_header_token(authorization_header=authorization)
+    if token is None:
+        await websocket.close(code=4010, reason="Invalid token")
+        return
+
+    acc_tok_data = decode_token_without_exception(token=token)
+    if acc_tok_data is None:
+        await websocket.close(code=4010, reason="Not authenticated")
+        return
+
+    user_id = acc_tok_data.user_id
+    record = await manager.register(websocket=websocket, user_id=user_id)
+
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                await _send_event(
+                    websocket, "error", detail="JSON data is required"
+                )
+                continue
+
+            event = data.get("event")
+            if event in ("subscribe", "unsubscribe"):
+                chats_id = _chats_id(data=data)
+                if chats_id is None:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail="Field chatIds must be a list of ids",
+                    )
+                    continue
+
+            if event == "subscribe":
+                since_messages_id = _since_messages_id(data=data)
+                if since_messages_id is None:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail="Field sinceMessageIds must map ids to ids",
+                    )
+                    continue
+
+                new_chats_id = set(chats_id) - record.chats_id
+                max_chats = settings.websockets["max_chats"]
+                if len(record.chats_id) + len(new_chats_id) > max_chats:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail=f"At most {max_chats} chats per socket",
+                    )
+                    continue
+
+                # One membership query for the whole frame
+                allowed = set()
+                if new_chats_id:
+                    async with async_session() as db:
+                        allowed = set(
+                            await service.find_participant_chats_id(
+                                user_id=user_id,
+                                chats_id=new_chats_id,
+                                db=db,
+                            )
+                        )
+                # Chats with a last seen message hold live messages until
+                # the missed ones are replayed
+                for chat_id in allowed:
+                    await manager.join(
+                        websocket=websocket,
+                        chat_id=chat_id,
+                        paused=chat_id in since_messages_id,
+                    )
+
+                await _send_event(
+                    websocket,
+                    "subscribed",
+                    chatIds=sorted(record.chats_id & set(chats_id)),
+                    rejected=sorted(new_chats_id - allowed),
+                )
+                for chat_id in sorted(allowed & since_messages_id.keys()):
+                    await _replay(
+                        websocket=websocket,
+                        chat_id=chat_id,
+                        since_id=since_messages_id[chat_id],
+                    )
+
+            elif event == "unsubscribe":
+                for chat_id in chats_id:
+                    await manager.leave(websocket=websocket, chat_id=chat_id)
+
+                await _send_event(websocket, "unsubscribed", chatIds=chats_id)
+
+            elif event == "typing":
+                chat_id = data.get("chatId")
+                if chat_id not in record.chats_id:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail="Field chatId of a subscribed chat is required",
+                    )
+                    continue
+
+                # Ephemeral, coalesced by the presence service
+                presence.typing(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    typing=bool(data.get("typing", True)),
+                )
+
+            elif event == "message":
+                chat_id = data.get("chatId")
+                msg_content = data.get("content")
+                if chat_id not in record.chats_id or msg_content is None:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail=(
+                            "Fields chatId of a subscribed chat and content "
+                            "are required"
+                        ),
+                    )
+                    continue
+
+                try:
+                    message = await message_writer.write(
+                        data=MessageCreateSchema(
+                            type=data.get("type", "text"),
+                            content=msg_content,
+                            chat_id=chat_id,
+                            owner_id=user_id,
+                        )
+                    )
+                except Exception:
+                    await _send_event(
+                        websocket,
+                        "error",
+                        detail="Message could not be saved",
+                    )
+                    continue
+
+                await manager.broadcast(
+                    message=_message_payload(message=message),
+                    chats_id=[chat_id],
+                )
+
+            else:
+                await _send_event(websocket, "error", detail="Unknown event")
+
+    except (WebSocketDisconnect, WebSocketException):
+        pass
+
+    finally:
+        await manager.disconnect(websocket=websocket)
+
+
 @router.websocket(path="/{chat_id}")
 async def ws_chat(
     websocket: WebSocket,
     chat_id: int,
     db: Annotated[AsyncSession, Depends(get_session)],
     authorization: str = Header(...),
+    since_message_id: int | None = None,
 ):
     token = get_authorization_header_token(authorization_header=authorization)
     if token is None:
@@ -290,71 +792,91 @@ async def ws_chat(
         await websocket.close(code=4040, reason="Chat not found")
         return
 
-    await manager.connect(websocket=websocket, chat_id=chat_id)
+    await manager.connect(
+        websocket=websocket,
+        chat_id=chat_id,
+        user_id=acc_tok_data.user_id,
+        paused=since_message_id is not None,
+    )
 
-    # current_time = datetime.now().strftime("%H:%M:%S")
+    try:
+        if since_message_id is not None:
+            await _replay(
+                websocket=websocket,
+                chat_id=chat_id,
+                since_id=since_message_id,
+            )
 
-    while True:
-        try:
-            data = json.loads(await websocket.receive_text())
+        # current_time = datetime.now().strftime("%H:%M:%S")
+
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                if not isinstance(data, dict):
+                    await manager.send_personal_message(
+                        websocket=websocket,
+                        message="Error: JSON data is required",
+                    )
+                    continue
+
+                if data.get("event") == "typing":
+                    presence.typing(
+                        chat_id=chat_id,
+                        user_id=acc_tok_data.user_id,
+                        typing=bool(data.get("typing", True)),
+                    )
+                    continue
+
+                msg_type = data.get("type", "text")
+                user_id = data.get("userId", None)
+                msg_content = data.get("content", None)
+                if user_id is None or msg_content is None:
+                    await manager.send_personal_message(
+                        websocket=websocket,
+                        message="Fields userId and content are required",
+                    )
+                    continue
+
+                try:
+                    message = await message_writer.write(
+                        data=MessageCreateSchema(
+                            type=msg_type,
+                            content=msg_content,
+                            chat_id=chat.id,
+                            owner_id=user_id,
+                        )
+                    )
+                except Exception:
+                    await manager.send_personal_message(
+                        websocket=websocket,
+                        message="Error: Message could not be saved",
+                    )
+                    continue
+
+                await manager.broadcast(
+                    message=_message_payload(message=message),
+                    chats_id=[chat_id],
+                )
 
-            msg_type = data.get("type", "text")
-            user_id = data.get("userId", None)
-            msg_content = data.get("content", None)
-            if user_id is None or msg_content is None:
+            except json.JSONDecodeError:
                 await manager.send_personal_message(
                     websocket=websocket,
-                    message="Fields userId and content are required",
+                    message="Error: JSON data is required",
                 )
-                continue
 
-            message = await service.create_message(
-                data=MessageCreateSchema(
-                    type=msg_type,
-                    content=msg_content,
-                    chat_id=chat.id,
-                    owner_id=user_id,
-                ),
-                db=db,
-            )
-            await service.add_readed_to_message(
-                id=chat_id,
-                message_id=message.id,
-                participants=[message.owner_id],
-                db=db,
-            )
-
-            await manager.broadcast(
-                message=json.dumps(
-                    {
-                        "time": message.created_at.strftime("%H:%M:%S"),
-                        "chatId": message.chat_id,
-                        "userId": message.owner_id,
-                        "message": message.content,
-                        "type": message.type,
-                    }
-                ),
-                chats_id=[chat_id],
-            )
-
-        except json.JSONDecodeError:
-            await manager.send_personal_message(
-                websocket=websocket,
-                message="Error: JSON data is required",
-            )
+            except WebSocketDisconnect:
+                await manager.send_personal_message(
+                    websocket=websocket,
+                    message=f"Disconnected from {chat_id}",
+                )
+                break
 
-        except WebSocketDisconnect:
-            await manager.send_personal_message(
-                websocket=websocket,
-                message=f"Disconnected from {chat_id}",
-            )
-            await manager.disconnect(websocket=websocket, chat_id=chat_id)
-            break
+            except WebSocketException as ex:
+                await manager.send_personal_message(
+                    websocket=websocket,
+                    message=f"Error: {str(ex)}",
+                )
+                break
 
-        except WebSocketException as ex:
-            await manager.send_personal_message(
-                websocket=websocket,
-                message=f"Error: {str(ex)}",
-            )
-            await manager.disconnect(websocket=websocket, chat_id=chat_id)
-            break
+    finally:
+        await manager.disconnect(websocket=websocket)
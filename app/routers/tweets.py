@@ -1,10 +1,22 @@
-from typing import Annotated, List
+from datetime import datetime
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from dependencies.commons import get_current_user, get_session
+from config.settings import settings
+from dependencies.commons import (
+    get_current_user,
+    get_pagination,
+    get_search,
+    get_session,
+)
+from schemas.paginations import PageSchema, PaginationSchema, SearchSchema
+from schemas.users import UserSchema
 from schemas.tweets import (
+    TweetBulkCreateSchema,
+    TweetBulkSchema,
     TweetSchema,
     TweetCreateSchema,
     TweetUpdateSchema,
@@ -12,6 +24,9 @@ from schemas.tweets import (
 from services.tweets import TweetService
 
 from utils.commons import Tags
+from utils.etags import is_not_modified, not_modified_response
+from utils.exports import MEDIA_TYPES, ExportFormats, encode_export
+from utils.timelines import timeline_store
 
 router = APIRouter(
     prefix="/tweets",
@@ -21,26 +36,164 @@ router = APIRouter(
 service = TweetService()
 
 
+@router.on_event("startup")
+async def startup_timeline_store():
+    await timeline_store.startup()
+
+
+@router.on_event("shutdown")
+async def shutdown_timeline_store():
+    await timeline_store.shutdown()
+
+
 @router.get(
     path="/",
-    response_model=List[TweetSchema],
+    response_model=PageSchema[TweetSchema],
     status_code=status.HTTP_200_OK,
     summary="Get all tweets",
 )
-async def get_all_tweets(db: Annotated[AsyncSession, Depends(get_session)]):
+async def get_all_tweets(
+    pagination: Annotated[PaginationSchema, Depends(get_pagination)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
     """
     Get tweets
 
-    This path operation get all tweets in the app.
+    This path operation get a page of tweets in the app, newest first.
 
-    Returns a json list with the tweet model
-    - id: int
+    Parameters
+    - Query parameter
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Tweet]
+    - next_cursor: str | None
+    """
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(
+            await service.find_all(pagination=pagination, db=db, fast=True)
+        )
+
+    return await service.find_all(pagination=pagination, db=db)
+
+
+@router.get(
+    path="/timeline",
+    response_model=PageSchema[TweetSchema],
+    status_code=status.HTTP_200_OK,
+    summary="Get home timeline",
+)
+async def get_home_timeline(
+    user: Annotated[UserSchema, Depends(get_current_user)],
+    pagination: Annotated[PaginationSchema, Depends(get_pagination)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Get home timeline
+
+    This path operation get a page of the current user home timeline, with
+    its own tweets and the tweets of the users it follows, newest first.
+
+    Parameters
+    - Query parameter
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Tweet]
+    - next_cursor: str | None
+    """
+    return await service.find_home_timeline(
+        user_id=user.id,
+        pagination=pagination,
+        db=db,
+    )
+
+
+@router.get(
+    path="/search",
+    response_model=PageSchema[TweetSchema],
+    status_code=status.HTTP_200_OK,
+    summary="Search tweets",
+)
+async def search_tweets(
+    search: Annotated[SearchSchema, Depends(get_search)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Search tweets
+
+    This path operation get a page of the tweets in the app matching a
+    full-text query, best match first.
+
+    Parameters
+    - Query parameter
+        - q: str
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[Tweet]
+    - next_cursor: str | None
+    """
+    page = await service.search(search=search, db=db)
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(page)
+
+    return page
+
+
+@router.get(
+    path="/export",
+    status_code=status.HTTP_200_OK,
+    summary="Export tweets",
+)
+async def export_tweets(
+    db: Annotated[AsyncSession, Depends(get_session)],
+    format: ExportFormats = ExportFormats.ndjson,
+    by_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after_id: int | None = None,
+):
+    """
+    Export tweets
+
+    This path operation stream the tweets in the app as NDJSON or CSV,
+    oldest first. Rows are written as they are read, pass the last
+    received id as after_id to resume an interrupted export.
+
+    Parameters
+    - Query parameter
+        - format: ndjson | csv
+        - by_id: int | None
+        - since: datetime | None
+        - until: datetime | None
+        - after_id: int | None
+
+    Returns a stream of the tweet model
     - content: str
-    - created_at: datetime
+    - id: int
+    - by_id: int
     - updated_at: datetime | None
-    - by: User
+    - created_at: datetime
     """
-    return await service.find_all(db=db)
+    batches = service.export(
+        db=db,
+        by_id=by_id,
+        since=since,
+        until=until,
+        after_id=after_id,
+    )
+    return StreamingResponse(
+        encode_export(
+            batches=batches,
+            export_format=format,
+            fields=list(TweetSchema.__fields__),
+        ),
+        media_type=MEDIA_TYPES[format],
+    )
 
 
 @router.get(
@@ -50,12 +203,16 @@ async def get_all_tweets(db: Annotated[AsyncSession, Depends(get_session)]):
     summary="Get tweet",
 )
 async def get_tweet(
-    tweet_id: int, db: Annotated[AsyncSession, Depends(get_session)]
+    tweet_id: int,
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_session)],
 ):
     """
     Get tweet
 
-    This path operation get a tweet in the app.
+    This path operation get a tweet in the app. It answers 304 without a
+    body when the If-None-Match header matches the tweet ETag.
 
     Parameters
     - Path parameter
@@ -68,6 +225,11 @@ async def get_tweet(
     - updated_at: datetime | None
     - by: User
     """
+    etag = await service.find_etag(id=tweet_id, db=db)
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag)
+
+    response.headers["ETag"] = etag
     return await service.find_one_by_id(id=tweet_id, db=db)
 
 
@@ -100,6 +262,34 @@ async def create_tweet(
     return await service.create(data=tweet, db=db)
 
 
+@router.post(
+    path="/bulk",
+    response_model=TweetBulkSchema,
+    status_code=status.HTTP_200_OK,
+    summary="Create tweets in bulk",
+)
+async def create_tweets(
+    data: TweetBulkCreateSchema,
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
+    """
+    Post tweets in bulk
+
+    This path operation post many tweets in the app in one transaction.
+    Tweets whose author does not exist are skipped and reported, the
+    others are created.
+
+    Parameters:
+    - Request body parameter
+        - data: List of tweets
+
+    Returns a json with the bulk result
+    - created: int
+    - results: List of {index: int, id: int | None, error: str | None}
+    """
+    return await service.create_many(data=data, db=db)
+
+
 @router.put(
     path="/{tweet_id}",
     response_model=TweetSchema,
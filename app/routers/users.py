@@ -1,39 +1,69 @@
-from typing import Annotated, List
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from dependencies.commons import get_current_user, get_session
+from config.settings import settings
+from dependencies.commons import (
+    get_current_user,
+    get_pagination,
+    get_session,
+)
+from schemas.paginations import PageSchema, PaginationSchema
 from schemas.users import UserSchema, UserUpdateSchema
-from services.users import UserService
+from services.timelines import TimelineService
+from services.users import UserService, user_cache
 
 from utils.commons import Tags
+from utils.etags import is_not_modified, not_modified_response
 
 router = APIRouter(prefix="/users", tags=[Tags.users.value])
 service = UserService()
+timeline_service = TimelineService()
+
+
+@router.on_event("startup")
+async def startup_user_cache():
+    await user_cache.startup()
+
+
+@router.on_event("shutdown")
+async def shutdown_user_cache():
+    await user_cache.shutdown()
 
 
 @router.get(
     path="/",
-    response_model=List[UserSchema],
+    response_model=PageSchema[UserSchema],
     status_code=status.HTTP_200_OK,
     summary="Get all users",
     dependencies=[Depends(get_current_user)],
 )
-async def get_all_users(db: Annotated[AsyncSession, Depends(get_session)]):
+async def get_all_users(
+    pagination: Annotated[PaginationSchema, Depends(get_pagination)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+):
     """
     Get users
 
-    This path operation get all users in the app.
+    This path operation get a page of users in the app, newest first.
 
-    Returns a json list with the user model
-    - id: int
-    - email: EmailStr
-    - first_name: str
-    - last_name: str
-    - birth_day: datetime | None
+    Parameters
+    - Query parameter
+        - cursor: str | None
+        - limit: int
+
+    Returns a json with the page
+    - items: List[User]
+    - next_cursor: str | None
     """
-    return await service.find_all(db=db)
+    if settings.serializers["fast_json"]:
+        return ORJSONResponse(
+            await service.find_all(pagination=pagination, db=db, fast=True)
+        )
+
+    return await service.find_all(pagination=pagination, db=db)
 
 
 @router.get(
@@ -69,12 +99,16 @@ async def get_me(
     dependencies=[Depends(get_current_user)],
 )
 async def get_user(
-    user_id: int, db: Annotated[AsyncSession, Depends(get_session)]
+    user_id: int,
+    request: Request,
+    response: Response,
+    db: Annotated[AsyncSession, Depends(get_session)],
 ):
     """
     Get user
 
-    This path operation get an user in the app.
+    This path operation get an user in the app. It answers 304 without a
+    body when the If-None-Match header matches the user ETag.
 
     Parameters
     - Path parameter
@@ -87,6 +121,11 @@ async def get_user(
     - last_name: str
     - birth_day: datetime | None
     """
+    etag = await service.find_etag(id=user_id, db=db)
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag)
+
+    response.headers["ETag"] = etag
     return await service.find_one_by_id(id=user_id, db=db)
 
 
@@ -146,3 +185,65 @@ async def delete_user(
     - success: bool
     """
     return await service.remove(id=user_id, db=db)
+
+
+@router.post(
+    path="/{user_id}/follow",
+    status_code=status.HTTP_200_OK,
+    summary="Follow user",
+)
+async def follow_user(
+    user_id: int,
+    user: Annotated[UserSchema, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+) -> dict:
+    """
+    Follow user
+
+    This path operation make the current user follow an user in the app.
+
+    Parameters
+        - Path parameter
+            - user_id: int
+
+    Returns a json with the follow relation and success property
+    - follower_id: int
+    - followed_id: int
+    - success: bool
+    """
+    return await timeline_service.follow(
+        follower_id=user.id,
+        followed_id=user_id,
+        db=db,
+    )
+
+
+@router.delete(
+    path="/{user_id}/follow",
+    status_code=status.HTTP_200_OK,
+    summary="Unfollow user",
+)
+async def unfollow_user(
+    user_id: int,
+    user: Annotated[UserSchema, Depends(get_current_user)],
+    db: Annotated[AsyncSession, Depends(get_session)],
+) -> dict:
+    """
+    Unfollow user
+
+    This path operation make the current user unfollow an user in the app.
+
+    Parameters
+        - Path parameter
+            - user_id: int
+
+    Returns a json with the follow relation and success property
+    - follower_id: int
+    - followed_id: int
+    - success: bool
+    """
+    return await timeline_service.unfollow(
+        follower_id=user.id,
+        followed_id=user_id,
+        db=db,
+    )
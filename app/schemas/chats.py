@@ -56,6 +56,19 @@ class ChatAddAdminsSchema(BaseModel):
     admins: List[int]
 
 
+class ChatReadSchema(BaseModel):
+    message_id: int
+
+    class Config:
+        schema_extra = {"example": {"message_id": 10}}
+
+
+class ChatUnreadSchema(BaseModel):
+    chat_id: int
+    last_read_message_id: int | None
+    unread_count: int
+
+
 class ChatUpdateSchema(BaseModel):
     logo: str | None
     title: str | None
@@ -107,3 +120,9 @@ class ChatAllSchema(ChatSchema):
     messages: List[MessageSchema]
     participants: List[UserSchema]
     admins: List[UserSchema]
+
+
+class ChatDetailSchema(ChatSchema):
+    participants_count: int
+    messages: List[MessageSchema]
+    messages_next_cursor: str | None = None
@@ -0,0 +1,29 @@
+from typing import Generic, List, TypeVar
+
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+
+ItemT = TypeVar("ItemT")
+
+
+class PaginationSchema(BaseModel):
+    before_id: int | None = None
+    limit: int
+
+
+class SearchSchema(PaginationSchema):
+    query: str
+    before_rank: float | None = None
+
+
+class PageSchema(GenericModel, Generic[ItemT]):
+    items: List[ItemT]
+    next_cursor: str | None = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "items": [],
+                "next_cursor": "eyJiZWZvcmVfaWQiOiAxMH0",
+            }
+        }
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List
 
 from pydantic import BaseModel
 
@@ -42,3 +43,25 @@ class TweetCreateSchema(TweetBaseSchema):
 
 class TweetUpdateSchema(TweetBaseSchema):
     pass
+
+
+class TweetBulkCreateSchema(BaseModel):
+    tweets: List[TweetCreateSchema]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "tweets": [TweetCreateSchema.Config.schema_extra["example"]]
+            }
+        }
+
+
+class TweetBulkItemSchema(BaseModel):
+    index: int
+    id: int | None = None
+    error: str | None = None
+
+
+class TweetBulkSchema(BaseModel):
+    created: int
+    results: List[TweetBulkItemSchema]
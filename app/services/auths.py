@@ -27,7 +27,7 @@ class AuthService:
         if user is None:
             raise EXCEPTION_401
 
-        password_match = verify_password(
+        password_match = await verify_password(
             password=password,
             hashed_password=user.password,
         )
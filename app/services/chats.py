@@ -1,18 +1,42 @@
-from typing import List, Sequence
+from typing import AsyncIterator, Iterable, List
 
 from fastapi import HTTPException, status
+from sqlalchemy import (
+    Integer,
+    Row,
+    bindparam,
+    case,
+    delete,
+    func,
+    literal,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.attributes import QueryableAttribute
 
+from config.settings import settings
 from db import models
 from models.chats import ChatTypes
 from schemas.chats import (
     ChatCreateSchema,
+    ChatSchema,
     ChatUpdateSchema,
     MessageCreateSchema,
+    MessageSchema,
 )
+from schemas.paginations import PaginationSchema, SearchSchema
+
+from utils.etags import make_etag
+from utils.exports import stream_rows
+from utils.paginations import paginate
+from utils.searches import full_text_search
+from utils.serializers import RowSerializer
+
+chat_serializer = RowSerializer(model=models.Chat, schema=ChatSchema)
+message_serializer = RowSerializer(model=models.Message, schema=MessageSchema)
 
 
 class ChatService(object):
@@ -23,16 +47,38 @@ class ChatService(object):
 
     MESSAGE_EXCEPTION_404 = HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
-        detail="Chat not found",
+        detail="Message not found",
     )
 
-    async def find_all_chats(self, db: AsyncSession) -> Sequence[models.Chat]:
+    async def find_all_chats(
+        self,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+        fast: bool = False,
+    ) -> dict:
         # chats = db.query(models.Chat).all()
+        return await paginate(
+            query=chat_serializer.select() if fast else select(models.Chat),
+            column=models.Chat.id,
+            pagination=pagination,
+            db=db,
+            serializer=chat_serializer if fast else None,
+        )
+
+    async def find_all_chats_etag(
+        self,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+    ) -> str:
+        query = select(models.Chat.id, models.Chat.updated_at)
+        if pagination.before_id is not None:
+            query = query.where(models.Chat.id < pagination.before_id)
+
         result = await db.execute(
-            select(models.Chat).order_by(models.Chat.id.desc())
+            query.order_by(models.Chat.id.desc()).limit(pagination.limit + 1)
         )
-        chats = result.scalars().all()
-        return chats
+        versions = [tuple(version) for version in result.all()]
+        return make_etag(pagination.limit, *versions)
 
     async def find_one_chat_by_id(
         self,
@@ -77,6 +123,50 @@ class ChatService(object):
         chat = result.scalars().first()
         return chat
 
+    async def find_chat_detail(self, id: int, db: AsyncSession) -> dict:
+        chat = await self.find_one_chat_by_id(id=id, db=db)
+
+        result = await db.execute(
+            select(func.count()).where(
+                models.ChatUserParticipant.chat_id == id
+            )
+        )
+        participants_count = result.scalar()
+
+        messages_page = await self.find_all_messages(
+            pagination=PaginationSchema(
+                limit=settings.messages["chat_preview_size"]
+            ),
+            db=db,
+            chat_id=id,
+        )
+        return {
+            **ChatSchema.from_orm(chat).dict(),
+            "participants_count": participants_count,
+            "messages": messages_page["items"],
+            "messages_next_cursor": messages_page["next_cursor"],
+        }
+
+    async def find_chat_etag(self, id: int, db: AsyncSession) -> str:
+        # The chat detail changes with its metadata, members and messages
+        result = await db.execute(
+            select(
+                models.Chat.id,
+                models.Chat.updated_at,
+                select(func.count())
+                .where(models.ChatUserParticipant.chat_id == id)
+                .scalar_subquery(),
+                select(func.max(models.Message.id))
+                .where(models.Message.chat_id == id)
+                .scalar_subquery(),
+            ).where(models.Chat.id == id)
+        )
+        version = result.first()
+        if version is None:
+            raise self.CHAT_EXCEPTION_404
+
+        return make_etag(*version)
+
     async def create_chat(
         self,
         data: ChatCreateSchema,
@@ -131,35 +221,36 @@ class ChatService(object):
         participants: List[int],
         db: AsyncSession,
     ) -> dict:
-        result = await db.execute(
-            select(models.Chat)
-            .where(models.Chat.id == id)
-            .options(selectinload(models.Chat.participants))
-        )
-        chat = result.scalars().first()
-        if chat is None:
-            raise self.CHAT_EXCEPTION_404
+        chat = await self.find_one_chat_by_id(id=id, db=db)
 
-        if chat.type == ChatTypes.SIMPLE and len(chat.participants) >= 2:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Simple chat should have 2 participants",
+        if chat.type == ChatTypes.SIMPLE:
+            result = await db.execute(
+                select(func.count()).where(
+                    models.ChatUserParticipant.chat_id == id
+                )
             )
+            if result.scalar() >= 2:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Simple chat should have 2 participants",
+                )
 
-        users_id_added = []
-        for participant_id in participants:
-            result = await db.execute(
-                select(models.User).where(models.User.id == participant_id)
+        result = await db.execute(
+            insert(models.ChatUserParticipant)
+            .from_select(
+                ["chat_id", "participant_id"],
+                select(literal(id, Integer), models.User.id).where(
+                    models.User.id.in_(participants)
+                ),
             )
-            user = result.scalars().first()
-            if user is not None:
-                chat.participants.append(user)
-                users_id_added.append(user.id)
+            .on_conflict_do_nothing()
+            .returning(models.ChatUserParticipant.participant_id)
+        )
+        users_id_added = self._affected(participants, result.scalars())
 
         await db.commit()
-        await db.refresh(chat)
         return {
-            "chat_id": chat.id,
+            "chat_id": id,
             "participants_added": users_id_added,
             "success": True,
         }
@@ -170,17 +261,7 @@ class ChatService(object):
         admins: List[int],
         db: AsyncSession,
     ) -> dict:
-        result = await db.execute(
-            select(models.Chat)
-            .where(models.Chat.id == id)
-            .options(
-                selectinload(models.Chat.admins),
-                selectinload(models.Chat.participants),
-            )
-        )
-        chat = result.scalars().first()
-        if chat is None:
-            raise self.CHAT_EXCEPTION_404
+        chat = await self.find_one_chat_by_id(id=id, db=db)
 
         if chat.type == ChatTypes.SIMPLE:
             raise HTTPException(
@@ -188,21 +269,27 @@ class ChatService(object):
                 detail="Simple chat should not have admins",
             )
 
-        users_id_added = []
-        for admin_id in admins:
-            result = await db.execute(
-                select(models.User).where(models.User.id == admin_id)
+        # Only participants of the chat can become admins
+        result = await db.execute(
+            insert(models.ChatUserAdmin)
+            .from_select(
+                ["chat_id", "admin_id"],
+                select(
+                    models.ChatUserParticipant.chat_id,
+                    models.ChatUserParticipant.participant_id,
+                ).where(
+                    models.ChatUserParticipant.chat_id == id,
+                    models.ChatUserParticipant.participant_id.in_(admins),
+                ),
             )
-            user = result.scalars().first()
-            if user is not None:
-                if user in chat.participants:
-                    chat.admins.append(user)
-                    users_id_added.append(user.id)
+            .on_conflict_do_nothing()
+            .returning(models.ChatUserAdmin.admin_id)
+        )
+        users_id_added = self._affected(admins, result.scalars())
 
         await db.commit()
-        await db.refresh(chat)
         return {
-            "chat_id": chat.id,
+            "chat_id": id,
             "admins_added": users_id_added,
             "success": True,
         }
@@ -213,30 +300,21 @@ class ChatService(object):
         participants: List[int],
         db: AsyncSession,
     ) -> dict:
-        result = await db.execute(
-            select(models.Chat)
-            .where(models.Chat.id == id)
-            .options(selectinload(models.Chat.participants))
-        )
-        chat = result.scalars().first()
-        if chat is None:
-            raise self.CHAT_EXCEPTION_404
+        await self.find_one_chat_by_id(id=id, db=db)
 
-        users_id_removed = []
-        for participant_id in participants:
-            result = await db.execute(
-                select(models.User).where(models.User.id == participant_id)
+        result = await db.execute(
+            delete(models.ChatUserParticipant)
+            .where(
+                models.ChatUserParticipant.chat_id == id,
+                models.ChatUserParticipant.participant_id.in_(participants),
             )
-            user = result.scalars().first()
-            if user is not None:
-                if user in chat.participants:
-                    chat.participants.remove(user)
-                    users_id_removed.append(user.id)
+            .returning(models.ChatUserParticipant.participant_id)
+        )
+        users_id_removed = self._affected(participants, result.scalars())
 
         await db.commit()
-        await db.refresh(chat)
         return {
-            "chat_id": chat.id,
+            "chat_id": id,
             "participants_removed": users_id_removed,
             "success": True,
         }
@@ -247,42 +325,81 @@ class ChatService(object):
         admins: List[int],
         db: AsyncSession,
     ) -> dict:
-        result = await db.execute(
-            select(models.Chat)
-            .where(models.Chat.id == id)
-            .options(selectinload(models.Chat.admins))
-        )
-        chat = result.scalars().first()
-        if chat is None:
-            raise self.CHAT_EXCEPTION_404
+        await self.find_one_chat_by_id(id=id, db=db)
 
-        users_id_removed = []
-        for admin_id in admins:
-            result = await db.execute(
-                select(models.User).where(models.User.id == admin_id)
+        result = await db.execute(
+            delete(models.ChatUserAdmin)
+            .where(
+                models.ChatUserAdmin.chat_id == id,
+                models.ChatUserAdmin.admin_id.in_(admins),
             )
-            user = result.scalars().first()
-            if user is not None:
-                if user in chat.admins:
-                    chat.admins.remove(user)
-                    users_id_removed.append(user.id)
+            .returning(models.ChatUserAdmin.admin_id)
+        )
+        users_id_removed = self._affected(admins, result.scalars())
 
         await db.commit()
-        await db.refresh(chat)
         return {
-            "chat_id": chat.id,
+            "chat_id": id,
             "admins_removed": users_id_removed,
             "success": True,
         }
 
     async def find_all_messages(
-        self, db: AsyncSession
-    ) -> Sequence[models.Message]:
-        result = await db.execute(
-            select(models.Message).order_by(models.Message.id.desc())
+        self,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+        chat_id: int | None = None,
+        fast: bool = False,
+    ) -> dict:
+        query = message_serializer.select() if fast else select(models.Message)
+        if chat_id is not None:
+            query = query.where(models.Message.chat_id == chat_id)
+
+        return await paginate(
+            query=query,
+            column=models.Message.id,
+            pagination=pagination,
+            db=db,
+            serializer=message_serializer if fast else None,
+        )
+
+    async def search_messages(
+        self,
+        chat_id: int,
+        search: SearchSchema,
+        db: AsyncSession,
+    ) -> dict:
+        return await full_text_search(
+            model=models.Message,
+            column=models.Message.content,
+            search=search,
+            serializer=message_serializer,
+            db=db,
+            group_column=models.Message.chat_id,
+            group=chat_id,
+        )
+
+    def export_messages(
+        self,
+        chat_id: int,
+        db: AsyncSession,
+        after_id: int | None = None,
+    ) -> AsyncIterator[List[dict]]:
+        # Ascending ids, an interrupted export resumes with after_id
+        query = (
+            message_serializer.select()
+            .where(models.Message.chat_id == chat_id)
+            .order_by(models.Message.id.asc())
+        )
+        if after_id is not None:
+            query = query.where(models.Message.id > after_id)
+
+        return stream_rows(
+            query=query,
+            serializer=message_serializer,
+            batch_size=settings.exports["batch_size"],
+            db=db,
         )
-        messages = result.scalars().all()
-        return messages
 
     async def create_message(
         self,
@@ -307,39 +424,164 @@ class ChatService(object):
         participants: List[int],
         db: AsyncSession,
     ) -> dict:
-        result = await db.execute(
-            select(models.Chat)
-            .where(models.Chat.id == id)
-            .options(selectinload(models.Chat.participants))
-        )
-        chat = result.scalars().first()
-        if chat is None:
-            raise self.CHAT_EXCEPTION_404
+        await self.find_one_chat_by_id(id=id, db=db)
 
         result = await db.execute(
-            select(models.Message)
-            .where(models.Message.id == message_id)
-            .options(selectinload(models.Message.read_by))
+            select(models.Message.id).where(
+                models.Message.id == message_id,
+                models.Message.chat_id == id,
+            )
         )
-        message = result.scalars().first()
-        if message is None:
+        if result.scalar() is None:
             raise self.MESSAGE_EXCEPTION_404
 
-        users_id_added = []
-        for participant_id in participants:
-            result = await db.execute(
-                select(models.User).where(models.User.id == participant_id)
+        # Only participants of the chat can read its messages
+        result = await db.execute(
+            update(models.ChatUserParticipant)
+            .where(
+                models.ChatUserParticipant.chat_id == id,
+                models.ChatUserParticipant.participant_id.in_(participants),
             )
-            user = result.scalars().first()
-            if user is not None:
-                if user in chat.participants:
-                    message.read_by.append(user)
-                    users_id_added.append(user.id)
+            .values(last_read_message_id=advance_watermark(message_id))
+            .returning(models.ChatUserParticipant.participant_id)
+        )
+        users_id_added = self._affected(participants, result.scalars())
 
         await db.commit()
-        await db.refresh(message)
         return {
-            "message_id": message.id,
+            "message_id": message_id,
             "participants_added": users_id_added,
             "success": True,
         }
+
+    async def mark_chat_as_read(
+        self,
+        id: int,
+        user_id: int,
+        message_id: int,
+        db: AsyncSession,
+    ) -> dict:
+        result = await self.add_readed_to_message(
+            id=id,
+            message_id=message_id,
+            participants=[user_id],
+            db=db,
+        )
+        if not result["participants_added"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User is not a participant of the chat",
+            )
+
+        return {"chat_id": id, "message_id": message_id, "success": True}
+
+    async def find_unread_counts(
+        self,
+        user_id: int,
+        db: AsyncSession,
+    ) -> List[dict]:
+        watermark = func.coalesce(
+            models.ChatUserParticipant.last_read_message_id, 0
+        )
+        result = await db.execute(
+            select(
+                models.ChatUserParticipant.chat_id,
+                models.ChatUserParticipant.last_read_message_id,
+                func.count(models.Message.id).label("unread_count"),
+            )
+            .select_from(models.ChatUserParticipant)
+            .outerjoin(
+                models.Message,
+                (models.Message.chat_id == models.ChatUserParticipant.chat_id)
+                & (models.Message.id > watermark),
+            )
+            .where(models.ChatUserParticipant.participant_id == user_id)
+            .group_by(
+                models.ChatUserParticipant.chat_id,
+                models.ChatUserParticipant.last_read_message_id,
+            )
+            .order_by(models.ChatUserParticipant.chat_id.desc())
+        )
+        return [row._asdict() for row in result.all()]
+
+    async def find_messages_since(
+        self,
+        chat_id: int,
+        since_id: int,
+        limit: int,
+        db: AsyncSession,
+    ) -> List[Row]:
+        # Range scan of ix_message_chat_id_id, oldest first
+        result = await db.execute(
+            select(
+                models.Message.id,
+                models.Message.type,
+                models.Message.content,
+                models.Message.chat_id,
+                models.Message.owner_id,
+                models.Message.created_at,
+            )
+            .where(
+                models.Message.chat_id == chat_id,
+                models.Message.id > since_id,
+            )
+            .order_by(models.Message.id.asc())
+            .limit(limit)
+        )
+        return result.all()
+
+    async def find_participant_chats_id(
+        self,
+        user_id: int,
+        chats_id: Iterable[int],
+        db: AsyncSession,
+    ) -> List[int]:
+        result = await db.execute(
+            select(models.ChatUserParticipant.chat_id).where(
+                models.ChatUserParticipant.participant_id == user_id,
+                models.ChatUserParticipant.chat_id.in_(set(chats_id)),
+            )
+        )
+        return result.scalars().all()
+
+    def _affected(
+        self,
+        requested: List[int],
+        affected: Iterable[int],
+    ) -> List[int]:
+        # Report affected ids once each, in the order they were requested
+        affected_set = set(affected)
+        return [
+            user_id
+            for user_id in dict.fromkeys(requested)
+            if user_id in affected_set
+        ]
+
+
+def advance_watermark(message_id):
+    """Read watermark value that only ever moves forward."""
+    watermark = models.ChatUserParticipant.last_read_message_id
+    return case(
+        (func.coalesce(watermark, 0) < message_id, message_id),
+        else_=watermark,
+    )
+
+
+def advance_watermarks_statement():
+    """
+    Executemany statement moving the read watermark of each
+    `(b_chat_id, b_user_id)` participant up to `b_message_id`.
+    """
+    table = models.ChatUserParticipant.__table__
+    return (
+        update(table)
+        .where(
+            table.c.chat_id == bindparam("b_chat_id"),
+            table.c.participant_id == bindparam("b_user_id"),
+        )
+        .values(
+            last_read_message_id=advance_watermark(
+                bindparam("b_message_id", type_=Integer)
+            )
+        )
+    )
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import Row, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from config.settings import settings
+from db import models
+from db.session import async_session
+from schemas.chats import MessageCreateSchema
+from services.chats import advance_watermarks_statement
+
+logger = logging.getLogger(__name__)
+
+PendingMessage = Tuple[dict, asyncio.Future]
+
+# Queued by shutdown, the flusher stops once its batch is written
+STOP = None
+
+
+class MessageBatchWriter(object):
+    """
+    Write-behind pipeline for chat messages.
+
+    Messages from every chat are grouped into one multi-row
+    INSERT ... RETURNING plus the owners' read watermarks, all in a single
+    transaction. A batch is flushed when it reaches `batch_size` or when
+    its first message waited `batch_delay_ms`. Shutdown lets the batch in
+    progress complete, then writes the messages still queued.
+    """
+
+    def __init__(self, session_factory: sessionmaker = async_session):
+        self.session_factory = session_factory
+        self.batch_size = settings.messages["batch_size"]
+        self.batch_delay = settings.messages["batch_delay_ms"] / 1000
+        self.queue: asyncio.Queue[PendingMessage | None] = asyncio.Queue()
+        self.flusher: asyncio.Task | None = None
+
+    async def startup(self):
+        self.flusher = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self.flusher is not None:
+            await self.queue.put(STOP)
+            await self.flusher
+            self.flusher = None
+
+        batch = []
+        while not self.queue.empty():
+            pending = self.queue.get_nowait()
+            if pending is not STOP:
+                batch.append(pending)
+
+        if batch:
+            await self._flush(batch)
+
+    async def write(self, data: MessageCreateSchema) -> Row:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((data.dict(), future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            pending = await self.queue.get()
+            if pending is STOP:
+                return
+
+            batch = [pending]
+            deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                if pending is STOP:
+                    stopping = True
+                    break
+                batch.append(pending)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[PendingMessage]):
+        try:
+            async with self.session_factory() as db:
+                rows = await self._insert(db, [values for values, _ in batch])
+        except Exception as ex:
+            if len(batch) == 1:
+                self._resolve(batch, exception=ex)
+                return
+
+            # Isolate the failing messages so they do not fail the others
+            logger.warning("Message batch failed, retrying alone: %s", ex)
+            for pending in batch:
+                await self._flush([pending])
+            return
+
+        self._resolve(batch, rows=rows)
+
+    async def _insert(
+        self,
+        db: AsyncSession,
+        values: List[dict],
+    ) -> List[Row]:
+        result = await db.execute(
+            insert(models.Message).returning(
+                models.Message.id,
+                models.Message.type,
+                models.Message.content,
+                models.Message.chat_id,
+                models.Message.owner_id,
+                models.Message.created_at,
+                sort_by_parameter_order=True,
+            ),
+            values,
+        )
+        rows = result.all()
+
+        # Owners read their own message, the update skips non participants
+        await db.execute(
+            advance_watermarks_statement(),
+            [
+                {
+                    "b_chat_id": row.chat_id,
+                    "b_user_id": row.owner_id,
+                    "b_message_id": row.id,
+                }
+                for row in rows
+            ],
+        )
+
+        await db.commit()
+        return rows
+
+    def _resolve(
+        self,
+        batch: List[PendingMessage],
+        rows: List[Row] = [],
+        exception: Exception | None = None,
+    ):
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(rows[index])
@@ -0,0 +1,222 @@
+from typing import Iterable, List, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config.settings import settings
+from db import models
+from schemas.paginations import PaginationSchema
+
+from utils.paginations import encode_cursor
+from utils.timelines import TimelineStore, timeline_store
+
+
+class TimelineService(object):
+    USER_EXCEPTION_404 = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="User not found",
+    )
+    FOLLOW_EXCEPTION_400 = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="User cannot follow itself",
+    )
+
+    def __init__(self, store: TimelineStore = timeline_store):
+        self.store = store
+        self.fan_out_limit = settings.timelines["fan_out_limit"]
+
+    async def follow(
+        self,
+        follower_id: int,
+        followed_id: int,
+        db: AsyncSession,
+    ) -> dict:
+        if follower_id == followed_id:
+            raise self.FOLLOW_EXCEPTION_400
+
+        result = await db.execute(
+            select(models.User.id).where(models.User.id == followed_id)
+        )
+        if result.scalar() is None:
+            raise self.USER_EXCEPTION_404
+
+        result = await db.execute(
+            insert(models.UserFollow)
+            .values(follower_id=follower_id, followed_id=followed_id)
+            .on_conflict_do_nothing()
+            .returning(models.UserFollow.followed_id)
+        )
+        followed = result.scalar() is not None
+        if followed:
+            await db.execute(
+                update(models.User)
+                .where(models.User.id == followed_id)
+                .values(followers_count=models.User.followers_count + 1)
+            )
+
+        await db.commit()
+        await self.store.discard(follower_id)
+        return {
+            "follower_id": follower_id,
+            "followed_id": followed_id,
+            "success": followed,
+        }
+
+    async def unfollow(
+        self,
+        follower_id: int,
+        followed_id: int,
+        db: AsyncSession,
+    ) -> dict:
+        result = await db.execute(
+            delete(models.UserFollow)
+            .where(
+                models.UserFollow.follower_id == follower_id,
+                models.UserFollow.followed_id == followed_id,
+            )
+            .returning(models.UserFollow.followed_id)
+        )
+        unfollowed = result.scalar() is not None
+        if unfollowed:
+            await db.execute(
+                update(models.User)
+                .where(models.User.id == followed_id)
+                .values(followers_count=models.User.followers_count - 1)
+            )
+
+        await db.commit()
+        await self.store.discard(follower_id)
+        return {
+            "follower_id": follower_id,
+            "followed_id": followed_id,
+            "success": unfollowed,
+        }
+
+    async def fan_out(self, tweet: models.Tweet, db: AsyncSession):
+        await self.fan_out_many(tweets=[(tweet.id, tweet.by_id)], db=db)
+
+    async def fan_out_many(
+        self,
+        tweets: Iterable[Tuple[int, int]],
+        db: AsyncSession,
+    ):
+        """Push (tweet_id, by_id) pairs, oldest first, to cached timelines."""
+        tweets = sorted(tweets)
+        if not tweets:
+            return
+
+        authors_id = set(by_id for _, by_id in tweets)
+        follow = models.UserFollow
+        result = await db.execute(
+            select(follow.followed_id, follow.follower_id)
+            .join(models.User, models.User.id == models.UserFollow.followed_id)
+            .where(
+                follow.followed_id.in_(authors_id),
+                models.User.followers_count <= self.fan_out_limit,
+            )
+        )
+        followers_id = {author_id: [author_id] for author_id in authors_id}
+        for followed_id, follower_id in result.all():
+            followers_id[followed_id].append(follower_id)
+
+        # Authors always see their own tweets, even when too popular
+        await self.store.push(
+            [(tweet_id, followers_id[by_id]) for tweet_id, by_id in tweets]
+        )
+
+    async def find_home_timeline(
+        self,
+        user_id: int,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+    ) -> dict:
+        before_id = pagination.before_id
+        limit = pagination.limit
+
+        tweets_id = self.store.get(user_id)
+        if tweets_id is None:
+            tweets_id = await self._build_timeline(user_id=user_id, db=db)
+
+        candidates = set(
+            tweet_id
+            for tweet_id in tweets_id
+            if before_id is None or tweet_id < before_id
+        )
+
+        # Popular authors are not fanned out on write, merge them on read
+        authors = models.Tweet.by_id.in_(self._followed_query(user_id, True))
+        truncated = len(tweets_id) >= self.store.max_length
+        if truncated and len(candidates) <= limit:
+            # Past the end of a truncated list, read every followed author
+            authors = or_(
+                models.Tweet.by_id == user_id,
+                models.Tweet.by_id.in_(self._followed_query(user_id)),
+            )
+
+        query = (
+            select(models.Tweet.id)
+            .where(authors)
+            .order_by(models.Tweet.id.desc())
+            .limit(limit + 1)
+        )
+        if before_id is not None:
+            query = query.where(models.Tweet.id < before_id)
+
+        result = await db.execute(query)
+        candidates.update(result.scalars().all())
+
+        page_id = sorted(candidates, reverse=True)[: limit + 1]
+        next_cursor = None
+        if len(page_id) > limit:
+            page_id = page_id[:limit]
+            next_cursor = encode_cursor(page_id[-1])
+
+        tweets = []
+        if page_id:
+            result = await db.execute(
+                select(models.Tweet)
+                .where(models.Tweet.id.in_(page_id))
+                .order_by(models.Tweet.id.desc())
+            )
+            tweets = result.scalars().all()
+
+        return {"items": tweets, "next_cursor": next_cursor}
+
+    def _followed_query(self, user_id: int, popular: bool | None = None):
+        query = (
+            select(models.UserFollow.followed_id)
+            .join(models.User, models.User.id == models.UserFollow.followed_id)
+            .where(models.UserFollow.follower_id == user_id)
+        )
+        followers_count = models.User.followers_count
+        if popular is None:
+            return query
+        if popular:
+            return query.where(followers_count > self.fan_out_limit)
+
+        return query.where(followers_count <= self.fan_out_limit)
+
+    async def _build_timeline(
+        self,
+        user_id: int,
+        db: AsyncSession,
+    ) -> List[int]:
+        result = await db.execute(
+            select(models.Tweet.id)
+            .where(
+                or_(
+                    models.Tweet.by_id == user_id,
+                    models.Tweet.by_id.in_(
+                        self._followed_query(user_id, False)
+                    ),
+                )
+            )
+            .order_by(models.Tweet.id.desc())
+            .limit(self.store.max_length)
+        )
+        tweets_id = result.scalars().all()
+        self.store.set(user_id, tweets_id)
+        return list(tweets_id)
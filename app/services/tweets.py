@@ -1,11 +1,29 @@
-from typing import Sequence
+from datetime import datetime
+from typing import AsyncIterator, List
 
 from fastapi import HTTPException, status
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from config.settings import settings
 from db import models
-from schemas.tweets import TweetCreateSchema, TweetUpdateSchema
+from schemas.paginations import PaginationSchema, SearchSchema
+from schemas.tweets import (
+    TweetBulkCreateSchema,
+    TweetCreateSchema,
+    TweetSchema,
+    TweetUpdateSchema,
+)
+from services.timelines import TimelineService
+
+from utils.etags import make_etag
+from utils.exports import stream_rows
+from utils.paginations import paginate
+from utils.searches import full_text_search, reindex
+from utils.serializers import RowSerializer
+
+tweet_serializer = RowSerializer(model=models.Tweet, schema=TweetSchema)
 
 
 class TweetService(object):
@@ -17,14 +35,39 @@ class TweetService(object):
         status_code=status.HTTP_404_NOT_FOUND,
         detail="User not found",
     )
+    BULK_EXCEPTION_413 = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=(
+            "Too many tweets, send at most "
+            f"{settings.tweets['bulk_max_size']} per request"
+        ),
+    )
 
-    async def find_all(self, db: AsyncSession) -> Sequence[models.Tweet]:
+    timelines = TimelineService()
+
+    async def find_all(
+        self,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+        fast: bool = False,
+    ) -> dict:
         # tweets = db.query(models.Tweet).all()
-        result = await db.execute(
-            select(models.Tweet).order_by(models.Tweet.id.desc())
+        return await paginate(
+            query=tweet_serializer.select() if fast else select(models.Tweet),
+            column=models.Tweet.id,
+            pagination=pagination,
+            db=db,
+            serializer=tweet_serializer if fast else None,
+        )
+
+    async def search(self, search: SearchSchema, db: AsyncSession) -> dict:
+        return await full_text_search(
+            model=models.Tweet,
+            column=models.Tweet.content,
+            search=search,
+            serializer=tweet_serializer,
+            db=db,
         )
-        tweets = result.scalars().all()
-        return tweets
 
     async def find_one_by_id(self, id: int, db: AsyncSession) -> models.Tweet:
         # tweet = db.query(models.Tweet).filter(models.Tweet.id == id).first()
@@ -37,6 +80,46 @@ class TweetService(object):
 
         return tweet
 
+    async def find_etag(self, id: int, db: AsyncSession) -> str:
+        result = await db.execute(
+            select(
+                models.Tweet.id,
+                models.Tweet.created_at,
+                models.Tweet.updated_at,
+            ).where(models.Tweet.id == id)
+        )
+        version = result.first()
+        if version is None:
+            raise self.TWEET_EXCEPTION_404
+
+        return make_etag(*version)
+
+    def export(
+        self,
+        db: AsyncSession,
+        by_id: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after_id: int | None = None,
+    ) -> AsyncIterator[List[dict]]:
+        # Ascending ids, an interrupted export resumes with after_id
+        query = tweet_serializer.select().order_by(models.Tweet.id.asc())
+        if by_id is not None:
+            query = query.where(models.Tweet.by_id == by_id)
+        if since is not None:
+            query = query.where(models.Tweet.created_at >= since)
+        if until is not None:
+            query = query.where(models.Tweet.created_at < until)
+        if after_id is not None:
+            query = query.where(models.Tweet.id > after_id)
+
+        return stream_rows(
+            query=query,
+            serializer=tweet_serializer,
+            batch_size=settings.exports["batch_size"],
+            db=db,
+        )
+
     async def create(
         self,
         data: TweetCreateSchema,
@@ -47,7 +130,7 @@ class TweetService(object):
         #     is not None
         # )
         result = await db.execute(
-            select(models.Tweet).filter(models.Tweet.id == id)
+            select(models.User.id).filter(models.User.id == data.by_id)
         )
         exists = result.scalars().first() is not None
         if not exists:
@@ -57,8 +140,72 @@ class TweetService(object):
         db.add(tweet)
         await db.commit()
         await db.refresh(tweet)
+        await self.timelines.fan_out(tweet=tweet, db=db)
         return tweet
 
+    async def create_many(
+        self,
+        data: TweetBulkCreateSchema,
+        db: AsyncSession,
+    ) -> dict:
+        if len(data.tweets) > settings.tweets["bulk_max_size"]:
+            raise self.BULK_EXCEPTION_413
+
+        # One lookup for every author instead of one per tweet
+        authors_id = set(tweet.by_id for tweet in data.tweets)
+        result = await db.execute(
+            select(models.User.id).where(models.User.id.in_(authors_id))
+        )
+        existing_id = set(result.scalars().all())
+
+        results = []
+        values = []
+        for index, tweet in enumerate(data.tweets):
+            if tweet.by_id in existing_id:
+                results.append({"index": index})
+                values.append(tweet.dict(exclude_unset=True))
+            else:
+                results.append(
+                    {"index": index, "error": self.USER_EXCEPTION_404.detail}
+                )
+
+        created = []
+        if values:
+            # Multi-row INSERT ... RETURNING, ids come back in input order
+            result = await db.execute(
+                insert(models.Tweet).returning(
+                    models.Tweet.id,
+                    models.Tweet.by_id,
+                    sort_by_parameter_order=True,
+                ),
+                values,
+            )
+            created = result.all()
+            await db.commit()
+
+        inserted = iter(created)
+        for item in results:
+            if "error" not in item:
+                item["id"] = next(inserted).id
+
+        await self.timelines.fan_out_many(
+            tweets=[(row.id, row.by_id) for row in created],
+            db=db,
+        )
+        return {"created": len(created), "results": results}
+
+    async def find_home_timeline(
+        self,
+        user_id: int,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+    ) -> dict:
+        return await self.timelines.find_home_timeline(
+            user_id=user_id,
+            pagination=pagination,
+            db=db,
+        )
+
     async def update(
         self,
         id: int,
@@ -76,6 +223,7 @@ class TweetService(object):
         tweet.content = data.content
         await db.commit()
         await db.refresh(tweet)
+        reindex(models.Tweet, tweet.id, tweet.content)
         return tweet
 
     async def remove(self, id: int, db: AsyncSession) -> dict:
@@ -1,14 +1,26 @@
-from typing import Sequence
-
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 # from models.users import User
+from config.settings import settings
 from db import models
-from schemas.users import UserRegisterSchema, UserUpdateSchema
+from schemas.paginations import PaginationSchema
+from schemas.users import UserRegisterSchema, UserSchema, UserUpdateSchema
 
 from libs.passlib import create_password_hash
+from utils.caches import SharedTTLCache
+from utils.etags import make_etag
+from utils.paginations import paginate
+from utils.serializers import RowSerializer
+
+user_cache = SharedTTLCache(
+    name="users",
+    max_size=settings.caches["users"]["max_size"],
+    ttl=settings.caches["users"]["ttl_secs"],
+    backend_url=settings.caches["broadcast_url"],
+)
+user_serializer = RowSerializer(model=models.User, schema=UserSchema)
 
 
 class UserService(object):
@@ -17,13 +29,20 @@ class UserService(object):
         detail="User not found",
     )
 
-    async def find_all(self, db: AsyncSession) -> Sequence[models.User]:
+    async def find_all(
+        self,
+        pagination: PaginationSchema,
+        db: AsyncSession,
+        fast: bool = False,
+    ) -> dict:
         # users = db.query(models.User).all()
-        result = await db.execute(
-            select(models.User).order_by(models.User.id.desc())
+        return await paginate(
+            query=user_serializer.select() if fast else select(models.User),
+            column=models.User.id,
+            pagination=pagination,
+            db=db,
+            serializer=user_serializer if fast else None,
         )
-        users = result.scalars().all()
-        return users
 
     async def find_one_by_id(self, id: int, db: AsyncSession) -> models.User:
         # user = db.query(models.User).filter(models.User.id == id).first()
@@ -36,6 +55,18 @@ class UserService(object):
 
         return user
 
+    async def find_etag(self, id: int, db: AsyncSession) -> str:
+        result = await db.execute(
+            select(models.User.id, models.User.updated_at).where(
+                models.User.id == id
+            )
+        )
+        version = result.first()
+        if version is None:
+            raise self.EXCEPTION_404
+
+        return make_etag(*version)
+
     async def find_one_by_email(
         self, email: str, db: AsyncSession
     ) -> models.User:
@@ -70,7 +101,7 @@ class UserService(object):
                 detail="User with this email already exists",
             )
 
-        data.password = create_password_hash(data.password)
+        data.password = await create_password_hash(data.password)
         user = models.User(**data.dict(exclude_unset=True))
         db.add(user)
         await db.commit()
@@ -96,6 +127,7 @@ class UserService(object):
             setattr(user, k, v)
 
         await db.commit()
+        await user_cache.invalidate(id)
         await db.refresh(user)
         return user
 
@@ -110,4 +142,5 @@ class UserService(object):
 
         await db.delete(user)
         await db.commit()
+        await user_cache.invalidate(id)
         return {"id": id, "success": True}
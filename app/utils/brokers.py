@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BroadcastBackend(ABC):
+    """
+    Pub/sub transport used to deliver broadcasts across workers.
+
+    Every worker subscribes only to the channels it has local listeners
+    for, and `on_message(channel, message)` is awaited for each delivery.
+    """
+
+    @abstractmethod
+    async def connect(self, on_message: MessageHandler):
+        ...
+
+    @abstractmethod
+    async def disconnect(self):
+        ...
+
+    @abstractmethod
+    async def subscribe(self, channel: str):
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str):
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+
+class MemoryBackend(BroadcastBackend):
+    """Single process backend, publishing is a direct local delivery."""
+
+    def __init__(self):
+        self.channels: set[str] = set()
+        self.on_message: MessageHandler | None = None
+
+    async def connect(self, on_message: MessageHandler):
+        self.on_message = on_message
+
+    async def disconnect(self):
+        self.channels.clear()
+        self.on_message = None
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    async def publish(self, channel: str, message: str):
+        if self.on_message is not None and channel in self.channels:
+            await self.on_message(channel, message)
+
+
+def _encode_command(*args: str) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode()
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by broker")
+
+    prefix, payload = line[:1], line[1:-2].decode()
+    if prefix == b"+":
+        return payload
+    if prefix == b"-":
+        raise BrokerError(payload)
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode()
+    if prefix == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+
+    raise BrokerError(f"Unexpected reply: {line!r}")
+
+
+class RedisBackend(BroadcastBackend):
+    """
+    Redis protocol (RESP) pub/sub backend over plain asyncio streams.
+
+    It uses one connection to publish and one to subscribe, and works with
+    any server speaking the Redis PUBLISH/SUBSCRIBE protocol. The
+    subscriber reconnects and resubscribes on connection loss.
+    """
+
+    RECONNECT_DELAY_SECS = 1
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channels: set[str] = set()
+        self.on_message: MessageHandler | None = None
+        self.publisher: asyncio.StreamWriter | None = None
+        self.subscriber: asyncio.StreamWriter | None = None
+        self.tasks: List[asyncio.Task] = []
+        self.publish_lock = asyncio.Lock()
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(_encode_command("AUTH", self.password))
+            await writer.drain()
+            await _read_reply(reader)
+
+        return reader, writer
+
+    async def connect(self, on_message: MessageHandler):
+        self.on_message = on_message
+        self.tasks = [
+            asyncio.create_task(self._run_publisher()),
+            asyncio.create_task(self._run_subscriber()),
+        ]
+
+    async def disconnect(self):
+        for task in self.tasks:
+            task.cancel()
+
+        for writer in (self.publisher, self.subscriber):
+            if writer is not None:
+                writer.close()
+
+        self.tasks = []
+        self.publisher = None
+        self.subscriber = None
+        self.channels.clear()
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+        await self._send_subscriber("SUBSCRIBE", channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+        await self._send_subscriber("UNSUBSCRIBE", channel)
+
+    async def publish(self, channel: str, message: str):
+        async with self.publish_lock:
+            if self.publisher is None:
+                raise BrokerError("Broker publisher is not connected")
+
+            # Replies are drained by the publisher task, no round trip here
+            self.publisher.write(_encode_command("PUBLISH", channel, message))
+            await self.publisher.drain()
+
+    async def _send_subscriber(self, *args: str):
+        if self.subscriber is None:
+            # Pending channels are subscribed again once connected
+            return
+
+        self.subscriber.write(_encode_command(*args))
+        await self.subscriber.drain()
+
+    async def _run_publisher(self):
+        while True:
+            try:
+                reader, self.publisher = await self._open()
+                while True:
+                    await _read_reply(reader)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.warning("Broker publisher disconnected: %s", ex)
+                self.publisher = None
+                await asyncio.sleep(self.RECONNECT_DELAY_SECS)
+
+    async def _run_subscriber(self):
+        while True:
+            try:
+                reader, self.subscriber = await self._open()
+                if self.channels:
+                    await self._send_subscriber("SUBSCRIBE", *self.channels)
+
+                while True:
+                    reply = await _read_reply(reader)
+                    if (
+                        isinstance(reply, list)
+                        and reply[0] == "message"
+                        and self.on_message is not None
+                    ):
+                        await self.on_message(reply[1], reply[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.warning("Broker subscriber disconnected: %s", ex)
+                self.subscriber = None
+                await asyncio.sleep(self.RECONNECT_DELAY_SECS)
+
+
+def get_broadcast_backend(url: str) -> BroadcastBackend:
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme in ("redis", "tcp"):
+        return RedisBackend(url=url)
+
+    raise BrokerError(f"Unsupported broadcast backend: {url}")
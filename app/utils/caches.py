@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from utils.brokers import BroadcastBackend, get_broadcast_backend
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Size bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class SharedTTLCache(TTLCache):
+    """
+    TTL cache whose invalidations reach every worker.
+
+    Values stay local to the process; only invalidated keys travel through
+    the broadcast backend, so a write on one worker evicts the entry
+    everywhere. Without a backend url it behaves as a local TTLCache.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl: float,
+        backend_url: str | None = None,
+    ):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.channel = f"cache:{name}"
+        self.backend: BroadcastBackend | None = (
+            get_broadcast_backend(url=backend_url) if backend_url else None
+        )
+
+    async def startup(self):
+        if self.backend is not None:
+            await self.backend.connect(on_message=self._on_invalidation)
+            await self.backend.subscribe(self.channel)
+
+    async def shutdown(self):
+        if self.backend is not None:
+            await self.backend.disconnect()
+
+    async def invalidate(self, key: Hashable):
+        self.delete(key)
+        if self.backend is None:
+            return
+
+        try:
+            await self.backend.publish(self.channel, json.dumps(key))
+        except Exception as ex:
+            # Other workers fall back to the entries ttl
+            logger.warning("Cache invalidation publish failed: %s", ex)
+
+    async def _on_invalidation(self, channel: str, message: str):
+        if channel == self.channel:
+            self.delete(json.loads(message))
@@ -1,34 +1,530 @@
-from typing import List
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Protocol, Set
+from weakref import WeakSet
 
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
 
+from config.settings import settings
+from utils.brokers import BroadcastBackend, get_broadcast_backend
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+FAN_OUT_BUCKETS = (0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000)
+
+chat_publish_duration = registry.histogram(
+    "chat_publish_duration_seconds",
+    "Time to publish a chat message to the broadcast backend.",
+    buckets=FAST_BUCKETS,
+)
+chat_fan_out_duration = registry.histogram(
+    "chat_fan_out_duration_seconds",
+    "Time to enqueue a broadcast message to the local sockets.",
+    buckets=FAST_BUCKETS,
+)
+chat_fan_out_sockets = registry.histogram(
+    "chat_fan_out_sockets",
+    "Local sockets a broadcast message was enqueued to.",
+    buckets=FAN_OUT_BUCKETS,
+)
+chat_messages_published = registry.counter(
+    "chat_messages_published_total",
+    "Messages published to chat and user channels.",
+)
+websocket_messages_sent = registry.counter(
+    "websocket_messages_sent_total",
+    "Messages written on websockets.",
+)
+websocket_send_delay = registry.histogram(
+    "websocket_send_delay_seconds",
+    "Time from enqueue to written on the websocket.",
+    buckets=FAST_BUCKETS,
+)
+websocket_send_failures = registry.counter(
+    "websocket_send_failures_total",
+    "Websocket sends that failed or dropped the client.",
+    labels=("reason",),
+)
+
+
+class ChatConnection:
+    """
+    Outbound side of a websocket.
+
+    Messages are queued without blocking the broadcaster and written by a
+    dedicated task, so a slow client only delays itself. A client whose
+    queue fills up or whose send times out is closed with SLOW_CLIENT_CODE,
+    one whose send fails with SEND_ERROR_CODE, so its route sees the
+    disconnect and deregisters it.
+    """
+
+    SLOW_CLIENT_CODE = 1013
+    SEND_ERROR_CODE = 1011
+
+    def __init__(self, websocket: WebSocket, max_queue: int, timeout: float):
+        self.websocket = websocket
+        self.timeout = timeout
+        self.queue: asyncio.Queue[tuple[float, str]] = asyncio.Queue(
+            maxsize=max_queue
+        )
+        self.writer = asyncio.create_task(self._write())
+        self.closer: asyncio.Task | None = None
+
+    def enqueue(self, message: str) -> bool:
+        if self.writer.done():
+            # Closing already, the queue is not drained anymore
+            return False
+
+        try:
+            self.queue.put_nowait((time.perf_counter(), message))
+        except asyncio.QueueFull:
+            websocket_send_failures.inc(reason="queue_full")
+            self.drop(reason="Client too slow")
+            return False
+
+        return True
+
+    async def enqueue_many(self, messages: Iterable[str]) -> bool:
+        """
+        Queue a backlog in chunks of half the queue, each one written before
+        the next is queued, so a backlog longer than the queue is not taken
+        for a slow client and live messages keep room next to it.
+        """
+        chunk_size = max(self.queue.maxsize // 2, 1)
+        for queued, message in enumerate(messages, 1):
+            if not self.enqueue(message):
+                return False
+            if queued % chunk_size == 0 and not await self._drained():
+                return False
+
+        return True
+
+    def drop(self, reason: str, code: int = SLOW_CLIENT_CODE):
+        if not self.writer.done():
+            self.writer.cancel()
+            self._close_later(code=code, reason=reason)
+
+    async def close(self):
+        self.writer.cancel()
+
+    def _close_later(self, code: int, reason: str):
+        # Referenced, the loop only keeps weak references to tasks
+        if self.closer is None:
+            self.closer = asyncio.create_task(
+                self._close(code=code, reason=reason)
+            )
+
+    async def _close(self, code: int, reason: str):
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code=code, reason=reason)
+            except Exception:
+                pass
+
+    async def _drained(self) -> bool:
+        # Written, or the writer exited and nothing will be anymore
+        drained = asyncio.ensure_future(self.queue.join())
+        try:
+            await asyncio.wait(
+                (drained, self.writer), return_when=asyncio.FIRST_COMPLETED
+            )
+            return drained.done()
+        finally:
+            drained.cancel()
+
+    async def _write(self):
+        while True:
+            enqueued_at, message = await self.queue.get()
+            try:
+                if not await self._send(message, enqueued_at):
+                    return
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, message: str, enqueued_at: float) -> bool:
+        if self.websocket.client_state != WebSocketState.CONNECTED:
+            return True
+
+        try:
+            await asyncio.wait_for(
+                self.websocket.send_text(message),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            websocket_send_failures.inc(reason="timeout")
+            self.drop(reason="Client too slow")
+            return False
+        except Exception as ex:
+            websocket_send_failures.inc(reason="error")
+            logger.info("Websocket send failed: %s", ex)
+            self._close_later(code=self.SEND_ERROR_CODE, reason="Send failed")
+            return False
+
+        websocket_messages_sent.inc()
+        websocket_send_delay.observe(time.perf_counter() - enqueued_at)
+        return True
+
+
+class ConnectionRecord:
+    """A registered websocket with its user, joined chats and send queue."""
+
+    __slots__ = ("websocket", "user_id", "chats_id", "connection", "paused")
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        connection: ChatConnection,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.chats_id: Set[int] = set()
+        self.connection = connection
+        # Live messages held per chat while its history is replayed
+        self.paused: Dict[int, List[str]] | None = None
+
+
+class MembershipListener(Protocol):
+    def joined(self, chat_id: int, user_id: int):
+        ...
+
+    def left(self, chat_id: int, user_id: int):
+        ...
+
 
 class ChatManager:
-    def __init__(self):
-        self.active_connections: dict[int, List[WebSocket]] = {}
+    """
+    Registry of the websockets of this process.
+
+    Records are indexed by socket, by joined chat and by user, so a socket
+    can multiplex many chats, and joining, leaving and disconnecting cost
+    O(1) per chat involved. Each chat and each user with local sockets is
+    subscribed to its own broadcast channel.
+    """
+
+    CHANNEL_PREFIX = "chat:"
+    USER_CHANNEL_PREFIX = "user:"
+
+    def __init__(self, backend: BroadcastBackend | None = None):
+        self.records: Dict[WebSocket, ConnectionRecord] = {}
+        self.chats: Dict[int, Set[ConnectionRecord]] = {}
+        self.users: Dict[int, Set[ConnectionRecord]] = {}
+        self.listeners: List[MembershipListener] = []
+        self.backend = backend or get_broadcast_backend(
+            url=settings.broadcasts["url"]
+        )
+        managers.add(self)
+
+    async def startup(self):
+        await self.backend.connect(on_message=self._on_backend_message)
+
+    async def shutdown(self):
+        for record in self.records.values():
+            await record.connection.close()
+
+        self.records.clear()
+        self.chats.clear()
+        self.users.clear()
+        await self.backend.disconnect()
+
+    async def register(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+    ) -> ConnectionRecord:
+        record = self.records.get(websocket)
+        if record is not None:
+            return record
 
-    async def connect(self, websocket: WebSocket, chat_id: int):
         await websocket.accept()
+        record = ConnectionRecord(
+            websocket=websocket,
+            user_id=user_id,
+            connection=ChatConnection(
+                websocket=websocket,
+                max_queue=settings.websockets["send_queue_size"],
+                timeout=settings.websockets["send_timeout_secs"],
+            ),
+        )
+        self.records[websocket] = record
+        await self._add(self.users, user_id, record, self._user_channel)
+        return record
 
-        if chat_id not in self.active_connections:
-            self.active_connections[chat_id] = [websocket]
-        else:
-            self.active_connections[chat_id].append(websocket)
+    async def join(
+        self,
+        websocket: WebSocket,
+        chat_id: int,
+        paused: bool = False,
+    ):
+        """
+        Deliver the messages of `chat_id` to the socket.
+
+        A `paused` join buffers live messages until `resume`, so history
+        read after joining can be sent first without gaps or duplicates.
+        """
+        record = self.records[websocket]
+        if chat_id not in record.chats_id:
+            if paused:
+                if record.paused is None:
+                    record.paused = {}
+                record.paused[chat_id] = []
+            record.chats_id.add(chat_id)
+            await self._add(self.chats, chat_id, record, self._channel)
+            for listener in self.listeners:
+                listener.joined(chat_id=chat_id, user_id=record.user_id)
+
+    async def resume(
+        self,
+        websocket: WebSocket,
+        chat_id: int,
+        after_id: int,
+    ):
+        """Flush the live messages of a paused chat newer than `after_id`."""
+        record = self.records.get(websocket)
+        if record is None or not record.paused or chat_id not in record.paused:
+            return
+
+        # Paused until the buffer is empty, so messages published while a
+        # chunk drains are appended behind the ones not flushed yet
+        buffered = record.paused[chat_id]
+        chunk_size = max(record.connection.queue.maxsize // 2, 1)
+        while buffered:
+            chunk = buffered[:chunk_size]
+            del buffered[:chunk_size]
+            # Messages already replayed are skipped, other events kept
+            flushed = await record.connection.enqueue_many(
+                message
+                for message in chunk
+                if json.loads(message).get("id", after_id + 1) > after_id
+            )
+            if not flushed:
+                break
+
+        # Left, and maybe joined again, while flushing
+        if record.paused and record.paused.get(chat_id) is buffered:
+            del record.paused[chat_id]
+            if not record.paused:
+                record.paused = None
+
+    async def leave(self, websocket: WebSocket, chat_id: int):
+        record = self.records.get(websocket)
+        if record is not None and chat_id in record.chats_id:
+            if record.paused:
+                record.paused.pop(chat_id, None)
+            record.chats_id.discard(chat_id)
+            await self._discard(self.chats, chat_id, record, self._channel)
+            for listener in self.listeners:
+                listener.left(chat_id=chat_id, user_id=record.user_id)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        chat_id: int,
+        user_id: int,
+        paused: bool = False,
+    ):
+        await self.register(websocket=websocket, user_id=user_id)
+        await self.join(websocket=websocket, chat_id=chat_id, paused=paused)
 
-    async def disconnect(self, websocket: WebSocket, chat_id: int):
-        self.active_connections[chat_id].remove(websocket)
+    async def disconnect(self, websocket: WebSocket):
+        record = self.records.pop(websocket, None)
+        if record is None:
+            return
 
-        if not self.active_connections[chat_id]:
-            del self.active_connections[chat_id]
+        for chat_id in record.chats_id:
+            await self._discard(self.chats, chat_id, record, self._channel)
+            for listener in self.listeners:
+                listener.left(chat_id=chat_id, user_id=record.user_id)
+        record.chats_id.clear()
+
+        await self._discard(
+            self.users, record.user_id, record, self._user_channel
+        )
+        await record.connection.close()
 
     async def send_personal_message(self, websocket: WebSocket, message: str):
-        if websocket.client_state == WebSocketState.CONNECTED:
+        record = self.records.get(websocket)
+        if record is not None:
+            # Keep ordering with the messages already queued for the socket
+            record.connection.enqueue(message)
+        elif websocket.client_state == WebSocketState.CONNECTED:
             await websocket.send_text(message)
 
+    async def send_personal_messages(
+        self,
+        websocket: WebSocket,
+        messages: Iterable[str],
+    ) -> bool:
+        """Send a backlog to the socket at the pace it is written."""
+        record = self.records.get(websocket)
+        if record is None:
+            return False
+
+        return await record.connection.enqueue_many(messages)
+
+    async def send_to_user(self, user_id: int, message: str):
+        await self._publish(
+            channel=self._user_channel(user_id),
+            message=message,
+            records=self.users.get(user_id, ()),
+        )
+
     async def broadcast(self, message: str, chats_id: List[int]):
         for to_chat_id in chats_id:
-            if to_chat_id in self.active_connections.keys():
-                for websocket in self.active_connections[to_chat_id]:
-                    if websocket.client_state == WebSocketState.CONNECTED:
-                        await websocket.send_text(message)
+            await self._publish(
+                channel=self._channel(to_chat_id),
+                message=message,
+                records=self.chats.get(to_chat_id, ()),
+                chat_id=to_chat_id,
+            )
+
+    async def _publish(
+        self,
+        channel: str,
+        message: str,
+        records: Iterable[ConnectionRecord],
+        chat_id: int | None = None,
+    ):
+        started_at = time.perf_counter()
+        try:
+            await self.backend.publish(channel, message)
+            chat_messages_published.inc()
+            chat_publish_duration.observe(time.perf_counter() - started_at)
+        except Exception as ex:
+            # Keep local sockets served while the broker is unreachable
+            logger.warning("Broadcast publish failed: %s", ex)
+            self._send_local(
+                message=message, records=records, chat_id=chat_id
+            )
+
+    async def _on_backend_message(self, channel: str, message: str):
+        chat_id = None
+        if channel.startswith(self.CHANNEL_PREFIX):
+            chat_id = int(channel[len(self.CHANNEL_PREFIX) :])
+            records = self.chats.get(chat_id, ())
+        elif channel.startswith(self.USER_CHANNEL_PREFIX):
+            user_id = int(channel[len(self.USER_CHANNEL_PREFIX) :])
+            records = self.users.get(user_id, ())
+        else:
+            return
+
+        self._send_local(message=message, records=records, chat_id=chat_id)
+
+    def _send_local(
+        self,
+        message: str,
+        records: Iterable[ConnectionRecord],
+        chat_id: int | None = None,
+    ):
+        # The same serialized message is shared by every recipient queue
+        started_at = time.perf_counter()
+        sockets = 0
+        for record in records:
+            if record.paused and chat_id in record.paused:
+                record.paused[chat_id].append(message)
+            else:
+                record.connection.enqueue(message)
+            sockets += 1
+
+        chat_fan_out_duration.observe(time.perf_counter() - started_at)
+        chat_fan_out_sockets.observe(sockets)
+
+    async def _add(
+        self,
+        index: Dict[int, Set[ConnectionRecord]],
+        key: int,
+        record: ConnectionRecord,
+        channel: Callable[[int], str],
+    ):
+        records = index.get(key)
+        if records is None:
+            records = index[key] = set()
+            await self.backend.subscribe(channel(key))
+        records.add(record)
+
+    async def _discard(
+        self,
+        index: Dict[int, Set[ConnectionRecord]],
+        key: int,
+        record: ConnectionRecord,
+        channel: Callable[[int], str],
+    ):
+        records = index.get(key)
+        if records is None:
+            return
+
+        records.discard(record)
+        if not records:
+            del index[key]
+            await self.backend.unsubscribe(channel(key))
+
+    def _channel(self, chat_id: int) -> str:
+        return f"{self.CHANNEL_PREFIX}{chat_id}"
+
+    def _user_channel(self, user_id: int) -> str:
+        return f"{self.USER_CHANNEL_PREFIX}{user_id}"
+
+
+# Live managers, read at scrape time so sockets cost nothing until then
+managers: "WeakSet[ChatManager]" = WeakSet()
+
+
+def _records() -> Iterable[ConnectionRecord]:
+    for manager in list(managers):
+        yield from manager.records.values()
+
+
+def _top_chats() -> dict:
+    sizes: Dict[int, int] = {}
+    for manager in list(managers):
+        for chat_id, records in manager.chats.items():
+            sizes[chat_id] = sizes.get(chat_id, 0) + len(records)
+
+    # Only the biggest rooms, a series per chat would not scale
+    top = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+    return {
+        (chat_id,): size
+        for chat_id, size in top[: settings.metrics["top_chats"]]
+    }
+
+
+def _queue_depths() -> List[int]:
+    return [record.connection.queue.qsize() for record in _records()]
+
+
+registry.gauge(
+    "websocket_connections",
+    "Websockets registered in this process.",
+    callback=lambda: {(): sum(len(m.records) for m in list(managers))},
+)
+registry.gauge(
+    "websocket_users",
+    "Users with at least one websocket in this process.",
+    callback=lambda: {(): sum(len(m.users) for m in list(managers))},
+)
+registry.gauge(
+    "websocket_chats",
+    "Chats with at least one websocket in this process.",
+    callback=lambda: {(): sum(len(m.chats) for m in list(managers))},
+)
+registry.gauge(
+    "chat_connections",
+    "Websockets of the chats with the most local sockets.",
+    labels=("chat_id",),
+    callback=_top_chats,
+)
+registry.gauge(
+    "websocket_send_queue_messages",
+    "Messages waiting in websocket send queues.",
+    callback=lambda: {(): sum(_queue_depths())},
+)
+registry.gauge(
+    "websocket_send_queue_max_depth",
+    "Longest websocket send queue.",
+    callback=lambda: {(): max(_queue_depths(), default=0)},
+)
@@ -0,0 +1,80 @@
+import csv
+import io
+from enum import Enum
+from typing import AsyncIterator, List
+
+import orjson
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.serializers import RowSerializer
+
+
+class ExportFormats(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormats.ndjson: "application/x-ndjson",
+    ExportFormats.csv: "text/csv",
+}
+
+
+async def stream_rows(
+    query: Select,
+    serializer: RowSerializer,
+    batch_size: int,
+    db: AsyncSession,
+) -> AsyncIterator[List[dict]]:
+    """Yield serialized rows in batches from a server-side cursor."""
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield [serializer.serialize(row) for row in rows]
+
+
+async def encode_ndjson(
+    batches: AsyncIterator[List[dict]],
+) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b"".join(orjson.dumps(row) + b"\n" for row in batch)
+
+
+def _csv_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+
+    return value
+
+
+async def encode_csv(
+    batches: AsyncIterator[List[dict]],
+    fields: List[str],
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in batches:
+        writer.writerows(
+            {k: _csv_value(v) for k, v in row.items()} for row in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only exports still get their header line
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_export(
+    batches: AsyncIterator[List[dict]],
+    export_format: ExportFormats,
+    fields: List[str],
+) -> AsyncIterator[bytes]:
+    if export_format == ExportFormats.csv:
+        return encode_csv(batches=batches, fields=fields)
+
+    return encode_ndjson(batches=batches)
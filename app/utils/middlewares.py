@@ -1,5 +1,69 @@
-from fastapi import FastAPI
+import logging
+import time
+from contextvars import ContextVar
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config.settings import settings
+from libs.jwt import get_token_cache_stats
+from libs.passlib import get_password_queue_depth, pwd_stats
+from utils.metrics import EventLoopLagSampler, registry
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+ROUTE_LABELS = ("method", "route")
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request.",
+    labels=ROUTE_LABELS + ("status",),
+    buckets=LATENCY_BUCKETS,
+)
+http_request_queries = registry.histogram(
+    "http_request_db_queries",
+    "SQL statements executed by a request.",
+    labels=ROUTE_LABELS,
+    buckets=QUERY_BUCKETS,
+)
+http_request_db_duration = registry.histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in SQL statements by a request.",
+    labels=ROUTE_LABELS,
+    buckets=LATENCY_BUCKETS,
+)
+http_request_query_threshold = registry.counter(
+    "http_request_query_threshold_exceeded_total",
+    "Requests issuing more SQL statements than the threshold, likely N+1.",
+    labels=ROUTE_LABELS,
+)
+db_queries = registry.counter(
+    "db_queries_total",
+    "SQL statements executed, requests and background tasks.",
+)
+db_duration = registry.counter(
+    "db_query_duration_seconds_total",
+    "Time spent in SQL statements, requests and background tasks.",
+)
+
+request_stats: ContextVar["RequestStats | None"] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
 
 def include_middlewares(app: FastAPI):
     app.add_middleware(
@@ -8,4 +72,171 @@ def include_middlewares(app: FastAPI):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-    )
\ No newline at end of file
+    )
+
+
+def include_metrics(app: FastAPI, engine: AsyncEngine):
+    """
+    Instrument requests and `engine`, sample the event loop lag and serve
+    every registered metric, chat sockets included, on /metrics.
+    """
+    instrument_engine(engine=engine)
+    registry.gauge(
+        "password_queue_depth",
+        "Password hash operations waiting for a worker thread.",
+        callback=lambda: {(): get_password_queue_depth()},
+    )
+    registry.counter(
+        "password_rejected_total",
+        "Password hash operations rejected with 503.",
+        callback=lambda: {(): pwd_stats["rejected"]},
+    )
+    registry.gauge(
+        "token_cache_size",
+        "Decoded JWTs cached.",
+        callback=lambda: {(): get_token_cache_stats()["size"]},
+    )
+    registry.counter(
+        "token_cache_requests_total",
+        "Decoded JWT cache lookups.",
+        labels=("result",),
+        callback=lambda: {
+            ("hit",): get_token_cache_stats()["hits"],
+            ("miss",): get_token_cache_stats()["misses"],
+        },
+    )
+    registry.counter(
+        "event_loop_cpu_seconds_total",
+        "CPU time of the event loop thread, not time blocked in syscalls, "
+        "see event_loop_lag_seconds for blocking.",
+        callback=lambda: {(): time.thread_time()},
+    )
+
+    lag_sampler = EventLoopLagSampler(
+        interval=settings.metrics["loop_lag_interval_secs"]
+    )
+    app.add_event_handler("startup", lag_sampler.start)
+    app.add_event_handler("shutdown", lag_sampler.stop)
+
+    app.add_middleware(
+        MetricsMiddleware,
+        query_threshold=settings.metrics["query_threshold"],
+    )
+    app.add_route("/metrics", metrics, include_in_schema=False)
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+def instrument_engine(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+    listeners = [
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+    ]
+    for name, listener in listeners:
+        if not event.contains(sync_engine, name, listener):
+            event.listen(sync_engine, name, listener)
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    context._metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    elapsed = time.perf_counter() - context._metrics_started_at
+    db_queries.inc()
+    db_duration.inc(elapsed)
+
+    # The async driver runs in a greenlet sharing the request context
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+class MetricsMiddleware:
+    """
+    Per-route latency, SQL count and DB time.
+
+    Requests issuing more than `query_threshold` SQL statements are logged
+    and counted, to catch N+1 regressions. Routes are labelled with their
+    path template, so path parameters do not explode the series count.
+    """
+
+    def __init__(self, app: ASGIApp, query_threshold: int):
+        self.app = app
+        self.query_threshold = query_threshold
+        self.routes: dict = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_stats.reset(token)
+            self._record(
+                scope=scope,
+                status_code=status_code,
+                elapsed=time.perf_counter() - started_at,
+                stats=stats,
+            )
+
+    def _record(
+        self,
+        scope: Scope,
+        status_code: int,
+        elapsed: float,
+        stats: RequestStats,
+    ):
+        labels = {"method": scope["method"], "route": self._route(scope)}
+        http_request_duration.observe(elapsed, status=status_code, **labels)
+        http_request_queries.observe(stats.queries, **labels)
+        http_request_db_duration.observe(stats.db_time, **labels)
+
+        if stats.queries > self.query_threshold:
+            http_request_query_threshold.inc(**labels)
+            logger.warning(
+                "%s %s issued %d SQL statements (threshold %d)",
+                labels["method"],
+                labels["route"],
+                stats.queries,
+                self.query_threshold,
+            )
+
+    def _route(self, scope: Scope) -> str:
+        # The router stores the matched endpoint in the shared scope
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+
+        if endpoint not in self.routes:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    self.routes[endpoint] = route.path
+                    break
+            else:
+                self.routes[endpoint] = endpoint.__name__
+        return self.routes[endpoint]
@@ -0,0 +1,100 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import QueryableAttribute
+
+from schemas.paginations import PaginationSchema
+from utils.serializers import RowSerializer
+
+CURSOR_EXCEPTION_400 = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail="Invalid cursor",
+)
+
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + padding)
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise CURSOR_EXCEPTION_400
+
+    if not isinstance(payload, dict):
+        raise CURSOR_EXCEPTION_400
+
+    return payload
+
+
+def encode_cursor(before_id: int) -> str:
+    return _encode({"before_id": before_id})
+
+
+def decode_cursor(cursor: str) -> int:
+    before_id = _decode(cursor).get("before_id")
+    if not isinstance(before_id, int):
+        raise CURSOR_EXCEPTION_400
+
+    return before_id
+
+
+def encode_search_cursor(before_rank: float, before_id: int) -> str:
+    return _encode({"before_rank": before_rank, "before_id": before_id})
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    payload = _decode(cursor)
+    before_rank = payload.get("before_rank")
+    before_id = payload.get("before_id")
+    if not isinstance(before_rank, (int, float)) or not isinstance(
+        before_id, int
+    ):
+        raise CURSOR_EXCEPTION_400
+
+    return float(before_rank), before_id
+
+
+async def paginate(
+    query: Select,
+    column: QueryableAttribute,
+    pagination: PaginationSchema,
+    db: AsyncSession,
+    serializer: RowSerializer | None = None,
+) -> dict:
+    """
+    Keyset pagination over a descending id column.
+
+    One extra row is fetched to know whether a next page exists, so every
+    page is a single index range scan on `column`. With a `serializer` the
+    query must be its column-only select and items are plain dicts.
+    """
+    if pagination.before_id is not None:
+        query = query.where(column < pagination.before_id)
+
+    query = query.order_by(column.desc()).limit(pagination.limit + 1)
+    result = await db.execute(query)
+    if serializer is None:
+        items = result.scalars().all()
+    else:
+        items = [serializer.serialize(row) for row in result.all()]
+
+    next_cursor = None
+    if len(items) > pagination.limit:
+        items = items[: pagination.limit]
+        last_item = items[-1]
+        next_cursor = encode_cursor(
+            last_item[column.key]
+            if serializer is not None
+            else getattr(last_item, column.key)
+        )
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Set
+
+from config.settings import settings
+from utils.chats import ChatManager
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+presence_updates = registry.counter(
+    "presence_updates_total",
+    "Presence and typing changes received.",
+    labels=("kind",),
+)
+presence_frames = registry.counter(
+    "presence_frames_total",
+    "Coalesced presence frames broadcast to chats.",
+)
+
+
+class ChatPresence:
+    """Presence of one chat and the changes not broadcast yet."""
+
+    __slots__ = (
+        "present",
+        "typing",
+        "online",
+        "offline",
+        "started",
+        "stopped",
+        "last_flush",
+        "timer",
+    )
+
+    def __init__(self):
+        # Local sockets per present user, typing user -> last keystroke
+        self.present: Dict[int, int] = {}
+        self.typing: Dict[int, float] = {}
+        self.online: Set[int] = set()
+        self.offline: Set[int] = set()
+        self.started: Set[int] = set()
+        self.stopped: Set[int] = set()
+        self.last_flush = 0.0
+        self.timer: asyncio.TimerHandle | None = None
+
+    def is_pending(self) -> bool:
+        return bool(
+            self.online or self.offline or self.started or self.stopped
+        )
+
+    def is_idle(self) -> bool:
+        return not (self.present or self.typing or self.is_pending())
+
+
+class PresenceService:
+    """
+    Ephemeral presence and typing indicators, never stored in the database.
+
+    Changes of a chat are coalesced into one "presence" frame, sent at
+    least `debounce_ms` after the first change and at most once every
+    `min_interval_ms`, so the broadcast rate of a chat is capped however
+    many users type in it. A frame carries the users that came online,
+    went offline, started and stopped typing; typing stops by itself after
+    `typing_ttl_secs` without keystrokes. State is per process, a user
+    connected to several workers is tracked by each of them.
+    """
+
+    def __init__(
+        self,
+        manager: ChatManager,
+        debounce_ms: int = settings.presences["debounce_ms"],
+        min_interval_ms: int = settings.presences["min_interval_ms"],
+        typing_ttl_secs: float = settings.presences["typing_ttl_secs"],
+    ):
+        self.manager = manager
+        self.debounce = debounce_ms / 1000
+        self.min_interval = min_interval_ms / 1000
+        self.typing_ttl = typing_ttl_secs
+        self.chats: Dict[int, ChatPresence] = {}
+        self.flushes: Set[asyncio.Task] = set()
+        manager.listeners.append(self)
+
+    async def shutdown(self):
+        for chat in self.chats.values():
+            if chat.timer is not None:
+                chat.timer.cancel()
+
+        self.chats.clear()
+        for task in list(self.flushes):
+            task.cancel()
+
+    def joined(self, chat_id: int, user_id: int):
+        chat = self.chats.setdefault(chat_id, ChatPresence())
+        chat.present[user_id] = chat.present.get(user_id, 0) + 1
+        if chat.present[user_id] == 1:
+            presence_updates.inc(kind="online")
+            chat.offline.discard(user_id)
+            chat.online.add(user_id)
+            self._schedule(chat_id, chat)
+
+    def left(self, chat_id: int, user_id: int):
+        chat = self.chats.get(chat_id)
+        if chat is None or user_id not in chat.present:
+            return
+
+        chat.present[user_id] -= 1
+        if chat.present[user_id] > 0:
+            return
+
+        del chat.present[user_id]
+        presence_updates.inc(kind="offline")
+        chat.online.discard(user_id)
+        chat.offline.add(user_id)
+        self._stop_typing(chat, user_id)
+        self._schedule(chat_id, chat)
+
+    def typing(self, chat_id: int, user_id: int, typing: bool):
+        chat = self.chats.get(chat_id)
+        if chat is None or user_id not in chat.present:
+            return
+
+        presence_updates.inc(kind="typing")
+        if not typing:
+            self._stop_typing(chat, user_id)
+        else:
+            # Keystrokes of a user already typing only refresh the expiry
+            if user_id not in chat.typing:
+                chat.stopped.discard(user_id)
+                chat.started.add(user_id)
+            chat.typing[user_id] = time.monotonic()
+
+        self._schedule(chat_id, chat)
+
+    def _stop_typing(self, chat: ChatPresence, user_id: int):
+        if chat.typing.pop(user_id, None) is not None:
+            if user_id in chat.started:
+                chat.started.discard(user_id)
+            else:
+                chat.stopped.add(user_id)
+
+    def _schedule(self, chat_id: int, chat: ChatPresence):
+        now = time.monotonic()
+        if chat.is_pending():
+            next_flush = chat.last_flush + self.min_interval
+            delay = max(self.debounce, next_flush - now)
+        elif chat.typing:
+            delay = min(chat.typing.values()) + self.typing_ttl - now
+        else:
+            if chat.timer is None and chat.is_idle():
+                del self.chats[chat_id]
+            return
+
+        loop = asyncio.get_running_loop()
+        delay = max(delay, 0)
+        if chat.timer is not None:
+            # A change must not wait for a later typing expiry timer
+            if chat.timer.when() <= loop.time() + delay:
+                return
+            chat.timer.cancel()
+
+        chat.timer = loop.call_later(delay, self._start_flush, chat_id)
+
+    def _start_flush(self, chat_id: int):
+        task = asyncio.create_task(self._flush(chat_id))
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def _flush(self, chat_id: int):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            return
+
+        chat.timer = None
+        expired_at = time.monotonic() - self.typing_ttl
+        for user_id, typed_at in list(chat.typing.items()):
+            if typed_at <= expired_at:
+                self._stop_typing(chat, user_id)
+
+        if chat.is_pending():
+            frame = json.dumps(
+                {
+                    "event": "presence",
+                    "chatId": chat_id,
+                    "online": sorted(chat.online),
+                    "offline": sorted(chat.offline),
+                    "typing": sorted(chat.started),
+                    "stoppedTyping": sorted(chat.stopped),
+                }
+            )
+            chat.online.clear()
+            chat.offline.clear()
+            chat.started.clear()
+            chat.stopped.clear()
+            chat.last_flush = time.monotonic()
+            presence_frames.inc()
+            try:
+                await self.manager.broadcast(message=frame, chats_id=[chat_id])
+            except Exception as ex:
+                logger.warning("Presence broadcast failed: %s", ex)
+
+        self._schedule(chat_id, chat)
@@ -0,0 +1,207 @@
+import re
+from collections import Counter
+from typing import Dict, List, Tuple, Type
+
+from sqlalchemy import and_, func, literal_column, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm.attributes import QueryableAttribute
+
+from db.base import Base
+from schemas.paginations import SearchSchema
+from utils.paginations import encode_search_cursor
+from utils.serializers import RowSerializer
+
+# Literal, not a bound parameter, so the planner matches the GIN expression
+# indexes `to_tsvector('simple', content)` of the search migration.
+SEARCH_CONFIG = literal_column("'simple'")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str | None) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def search_vector(column: QueryableAttribute):
+    return func.to_tsvector(SEARCH_CONFIG, column)
+
+
+class InvertedIndex:
+    """
+    In-process inverted index used where Postgres full-text is missing.
+
+    Every query term must match and documents are ranked by the share of
+    their tokens that are query terms, like `ts_rank` without weights.
+    The websearch operators (quotes, or, -) are not supported. New rows are
+    picked up incrementally by id, so the index only works for one process.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.documents: Dict[int, Tuple[int | None, List[str]]] = {}
+        self.last_id = 0
+
+    def add(self, doc_id: int, text: str | None, group: int | None = None):
+        self.remove(doc_id)
+        tokens = tokenize(text)
+        self.documents[doc_id] = (group, tokens)
+        for token, count in Counter(tokens).items():
+            self.postings.setdefault(token, {})[doc_id] = count
+
+        self.last_id = max(self.last_id, doc_id)
+
+    def remove(self, doc_id: int):
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return
+
+        for token in set(entry[1]):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def search(
+        self,
+        query: str,
+        group: int | None = None,
+    ) -> List[Tuple[float, int]]:
+        """Return (rank, doc_id) pairs, best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        # Intersect from the rarest term to keep the candidate set small
+        postings = sorted(
+            (self.postings.get(term, {}) for term in terms), key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+
+        hits = []
+        for doc_id in candidates:
+            doc_group, tokens = self.documents[doc_id]
+            if group is not None and doc_group != group:
+                continue
+
+            matches = sum(posting[doc_id] for posting in postings)
+            hits.append((matches / len(tokens), doc_id))
+
+        hits.sort(reverse=True)
+        return hits
+
+
+search_indexes: Dict[str, InvertedIndex] = {}
+
+
+def reindex(model: Type[Base], doc_id: int, text: str | None, group=None):
+    """Refresh a row already picked up by the in-process index, if any."""
+    index = search_indexes.get(model.__tablename__)
+    if index is not None and doc_id in index.documents:
+        index.add(doc_id, text, group)
+
+
+async def full_text_search(
+    model: Type[Base],
+    column: QueryableAttribute,
+    search: SearchSchema,
+    serializer: RowSerializer,
+    db: AsyncSession,
+    group_column: QueryableAttribute | None = None,
+    group: int | None = None,
+) -> dict:
+    """
+    Ranked full-text search with keyset pagination on (rank, id).
+
+    Postgres uses the GIN expression index over `to_tsvector('simple', ..)`
+    with `websearch_to_tsquery`, other dialects fall back to an in-process
+    `InvertedIndex`. Items are plain dicts produced by the `serializer`.
+    """
+    if db.bind.dialect.name == "postgresql":
+        hits = await _search_postgres(
+            model, column, search, serializer, db, group_column, group
+        )
+    else:
+        hits = await _search_memory(
+            model, column, search, serializer, db, group_column, group
+        )
+
+    next_cursor = None
+    if len(hits) > search.limit:
+        hits = hits[: search.limit]
+        rank, item = hits[-1]
+        next_cursor = encode_search_cursor(rank, item["id"])
+
+    return {"items": [item for _, item in hits], "next_cursor": next_cursor}
+
+
+async def _search_postgres(
+    model, column, search, serializer, db, group_column, group
+) -> List[Tuple[float, dict]]:
+    vector = search_vector(column)
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, search.query)
+    rank = func.ts_rank(vector, tsquery)
+
+    query = (
+        serializer.select()
+        .add_columns(rank.label("rank"))
+        .where(vector.op("@@")(tsquery))
+    )
+    if group_column is not None:
+        query = query.where(group_column == group)
+    if search.before_rank is not None:
+        query = query.where(
+            or_(
+                rank < search.before_rank,
+                and_(
+                    rank == search.before_rank,
+                    model.id < search.before_id,
+                ),
+            )
+        )
+
+    query = query.order_by(rank.desc(), model.id.desc()).limit(
+        search.limit + 1
+    )
+    result = await db.execute(query)
+    return [(row.rank, serializer.serialize(row)) for row in result.all()]
+
+
+async def _search_memory(
+    model, column, search, serializer, db, group_column, group
+) -> List[Tuple[float, dict]]:
+    index = search_indexes.setdefault(model.__tablename__, InvertedIndex())
+
+    # Catch up with the rows inserted since the last search
+    columns = [model.id, column]
+    if group_column is not None:
+        columns.append(group_column)
+    result = await db.execute(
+        select(*columns)
+        .where(model.id > index.last_id)
+        .order_by(model.id.asc())
+    )
+    for row in result.all():
+        index.add(*row)
+
+    hits = index.search(search.query, group=group)
+    if search.before_rank is not None:
+        cursor = (search.before_rank, search.before_id)
+        hits = [hit for hit in hits if hit < cursor]
+    hits = hits[: search.limit + 1]
+    if not hits:
+        return []
+
+    hits_id = [doc_id for _, doc_id in hits]
+    result = await db.execute(serializer.select().where(model.id.in_(hits_id)))
+    items = {item["id"]: item for item in map(serializer.serialize, result)}
+
+    # Rows deleted since they were indexed are dropped from the index
+    for _, doc_id in hits:
+        if doc_id not in items:
+            index.remove(doc_id)
+
+    return [(rank, items[doc_id]) for rank, doc_id in hits if doc_id in items]
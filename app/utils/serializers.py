@@ -0,0 +1,45 @@
+from copy import copy
+from typing import Type
+
+from pydantic import BaseModel
+from sqlalchemy import Row, Select
+from sqlalchemy.future import select
+
+from db.base import Base
+
+
+class RowSerializer:
+    """
+    Precompiled serializer from column-only rows to a schema shaped dict.
+
+    The select only loads the columns of the schema fields, in the schema
+    field order, so rows skip ORM identity-map hydration and pydantic
+    validation while producing the same JSON as `schema.from_orm`. Fields
+    without a column get their schema default.
+    """
+
+    def __init__(self, model: Type[Base], schema: Type[BaseModel]):
+        columns = model.__table__.columns
+        self.fields = list(schema.__fields__)
+        self.columns = [
+            getattr(model, name) for name in self.fields if name in columns
+        ]
+        self.defaults = {
+            name: field.default
+            for name, field in schema.__fields__.items()
+            if name not in columns
+        }
+
+    def select(self) -> Select:
+        return select(*self.columns)
+
+    def serialize(self, row: Row) -> dict:
+        values = row._mapping
+        return {
+            name: (
+                values[name]
+                if name not in self.defaults
+                else copy(self.defaults[name])
+            )
+            for name in self.fields
+        }
@@ -0,0 +1,134 @@
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Iterable, List, Tuple
+
+from config.settings import settings
+from utils.brokers import BroadcastBackend, get_broadcast_backend
+
+logger = logging.getLogger(__name__)
+
+TimelinePush = Tuple[int, List[int]]
+
+
+class TimelineStore:
+    """
+    Bounded per-user home timeline lists kept in process memory.
+
+    Only timelines that were already materialized by a read receive pushes,
+    so a list never hides older tweets it did not see. Every worker holds
+    its own lists, pushes and discards reach the other workers through the
+    broadcast backend. Without a backend url, or when a publish fails, the
+    lists of the other workers go stale until they expire after `ttl_secs`.
+    """
+
+    CHANNEL = "timelines"
+
+    def __init__(
+        self,
+        max_length: int,
+        max_cached: int,
+        ttl_secs: int,
+        backend_url: str | None = None,
+    ):
+        self.max_length = max_length
+        self.max_cached = max_cached
+        self.ttl_secs = ttl_secs
+        self.timelines: OrderedDict[int, tuple[float, deque[int]]] = (
+            OrderedDict()
+        )
+        # Tells our own messages apart, they are applied before publishing
+        self.origin = uuid.uuid4().hex
+        self.backend: BroadcastBackend | None = (
+            get_broadcast_backend(url=backend_url) if backend_url else None
+        )
+
+    async def startup(self):
+        if self.backend is not None:
+            await self.backend.connect(on_message=self._on_message)
+            await self.backend.subscribe(self.CHANNEL)
+
+    async def shutdown(self):
+        if self.backend is not None:
+            await self.backend.disconnect()
+
+    def get(self, user_id: int) -> List[int] | None:
+        entry = self.timelines.get(user_id)
+        if entry is None:
+            return None
+
+        created_at, tweets_id = entry
+        if time.monotonic() - created_at > self.ttl_secs:
+            del self.timelines[user_id]
+            return None
+
+        self.timelines.move_to_end(user_id)
+        return list(tweets_id)
+
+    def set(self, user_id: int, tweets_id: Iterable[int]):
+        self.timelines[user_id] = (
+            time.monotonic(),
+            deque(sorted(tweets_id, reverse=True), maxlen=self.max_length),
+        )
+        self.timelines.move_to_end(user_id)
+
+        while len(self.timelines) > self.max_cached:
+            self.timelines.popitem(last=False)
+
+    async def push(self, pushes: List[TimelinePush]):
+        """Push (tweet_id, users_id) pairs, oldest first, on every worker."""
+        self._push(pushes)
+        await self._publish({"pushes": pushes})
+
+    async def discard(self, user_id: int):
+        self._discard(user_id)
+        await self._publish({"discard": user_id})
+
+    def _push(self, pushes: Iterable[TimelinePush]):
+        for tweet_id, users_id in pushes:
+            for user_id in users_id:
+                entry = self.timelines.get(user_id)
+                if entry is None:
+                    continue
+
+                tweets_id = entry[1]
+                if not tweets_id or tweet_id > tweets_id[0]:
+                    tweets_id.appendleft(tweet_id)
+                elif tweet_id not in tweets_id:
+                    # Older than the head, a concurrent write of another
+                    # worker, rebuilt in order by the next read
+                    del self.timelines[user_id]
+
+    def _discard(self, user_id: int):
+        self.timelines.pop(user_id, None)
+
+    async def _publish(self, data: dict):
+        if self.backend is None:
+            return
+
+        try:
+            await self.backend.publish(
+                self.CHANNEL, json.dumps({"origin": self.origin, **data})
+            )
+        except Exception as ex:
+            logger.warning("Timeline publish failed: %s", ex)
+
+    async def _on_message(self, channel: str, message: str):
+        data = json.loads(message)
+        if channel != self.CHANNEL or data["origin"] == self.origin:
+            return
+
+        if "pushes" in data:
+            self._push(data["pushes"])
+        if "discard" in data:
+            self._discard(data["discard"])
+
+
+timeline_store = TimelineStore(
+    max_length=settings.timelines["max_length"],
+    max_cached=settings.timelines["max_cached"],
+    ttl_secs=settings.timelines["ttl_secs"],
+    backend_url=settings.caches["broadcast_url"],
+)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the app import each other from the app directory
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "app"))
@@ -0,0 +1,414 @@
+"""
+Load test for a running API.
+
+Seeds users, chats and tweets straight into the database configured for the
+app, then drives N authenticated websocket clients over the multiplexed
+/chats/ws socket and M HTTP clients against the hot read endpoints. It
+reports p50/p95/p99 latencies, throughput and fan-out delivery lag as JSON,
+so results of two commits can be diffed.
+
+Run it from the repository root with the same environment (.env) as the
+server, since tokens are signed locally:
+
+    python tests/scripts/benchmark.py --ws-clients 50 --http-clients 10 \\
+        --output benchmark.json
+
+Needs the `websockets` and `httpx` packages on top of the app requirements.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+import websockets
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "app")
+)
+
+from sqlalchemy import insert, update  # noqa: E402
+
+from db import models  # noqa: E402
+from db.session import async_session, engine  # noqa: E402
+from libs.jwt import create_access_token  # noqa: E402
+from libs.passlib import create_password_hash  # noqa: E402
+from models.chats import ChatTypes  # noqa: E402
+
+# websockets 14 renamed the handshake headers argument
+HEADERS_ARG = (
+    "additional_headers"
+    if int(websockets.__version__.split(".")[0]) >= 14
+    else "extra_headers"
+)
+MESSAGE_PREFIX = "bench"
+HTTP_ENDPOINTS = [
+    "/tweets/?limit=20",
+    "/tweets/timeline?limit=20",
+    "/tweets/search?q=bench&limit=20",
+    "/chats/unread",
+    "/users/{user_id}",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--tweets", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=10)
+    parser.add_argument("--ws-clients", type=int, default=20)
+    parser.add_argument("--http-clients", type=int, default=5)
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=50,
+        help="messages sent by each websocket client",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=10,
+        help="messages per second of each websocket client",
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=2,
+        help="seconds to wait for late deliveries",
+    )
+    parser.add_argument("--output", help="JSON report path, default stdout")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], rank: float) -> float | None:
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    index = max(0, int(round(rank / 100 * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(values_ms: List[float]) -> dict:
+    return {
+        "count": len(values_ms),
+        "mean": sum(values_ms) / len(values_ms) if values_ms else None,
+        "p50": percentile(values_ms, 50),
+        "p95": percentile(values_ms, 95),
+        "p99": percentile(values_ms, 99),
+        "max": max(values_ms) if values_ms else None,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(args: argparse.Namespace) -> dict:
+    run = uuid.uuid4().hex[:8]
+    password = await create_password_hash("benchmark")
+
+    async with async_session() as db:
+        result = await db.execute(
+            insert(models.User).returning(
+                models.User.id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "email": f"{MESSAGE_PREFIX}-{run}-{i}@example.com",
+                    "password": password,
+                    "first_name": "Bench",
+                    "last_name": str(i),
+                }
+                for i in range(args.users)
+            ],
+        )
+        users_id = result.scalars().all()
+
+        result = await db.execute(
+            insert(models.Chat).returning(
+                models.Chat.id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "type": ChatTypes.GROUP,
+                    "title": f"{MESSAGE_PREFIX}-{run}-{i}",
+                    "logo": "",
+                }
+                for i in range(args.chats)
+            ],
+        )
+        chats_id = result.scalars().all()
+
+        await db.execute(
+            insert(models.ChatUserParticipant),
+            [
+                {"chat_id": chat_id, "participant_id": user_id}
+                for chat_id in chats_id
+                for user_id in users_id
+            ],
+        )
+
+        follows = [
+            {
+                "follower_id": user_id,
+                "followed_id": users_id[(i + step) % len(users_id)],
+            }
+            for i, user_id in enumerate(users_id)
+            for step in range(1, min(args.follows, len(users_id) - 1) + 1)
+        ]
+        if follows:
+            await db.execute(insert(models.UserFollow), follows)
+            await db.execute(
+                update(models.User)
+                .where(models.User.id.in_(users_id))
+                .values(followers_count=min(args.follows, len(users_id) - 1))
+            )
+
+        if args.tweets:
+            await db.execute(
+                insert(models.Tweet),
+                [
+                    {
+                        "content": f"{MESSAGE_PREFIX} tweet {i}",
+                        "by_id": random.choice(users_id),
+                    }
+                    for i in range(args.tweets)
+                ],
+            )
+
+        await db.commit()
+
+    await engine.dispose()
+    return {"run": run, "users_id": users_id, "chats_id": chats_id}
+
+
+def auth_headers(user_id: int) -> Dict[str, str]:
+    token = create_access_token(user_id=user_id).access_token
+    return {"Authorization": f"Bearer {token}"}
+
+
+class WsClient:
+    def __init__(self, index: int, user_id: int, chat_id: int, stats: dict):
+        self.index = index
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.stats = stats
+        self.ready = asyncio.Event()
+
+    async def run(self, url: str, args, start: asyncio.Event):
+        try:
+            await self._run(url=url, args=args, start=start)
+        finally:
+            # Never leave the start barrier waiting on a failed client
+            self.ready.set()
+
+    async def _run(self, url: str, args, start: asyncio.Event):
+        async with websockets.connect(
+            url, **{HEADERS_ARG: auth_headers(self.user_id)}
+        ) as ws:
+            await ws.send(
+                json.dumps({"event": "subscribe", "chatIds": [self.chat_id]})
+            )
+            ack = json.loads(await ws.recv())
+            if self.chat_id not in ack.get("chatIds", []):
+                raise RuntimeError(f"Subscription rejected: {ack}")
+
+            receiver = asyncio.create_task(self._receive(ws))
+            self.ready.set()
+            await start.wait()
+
+            interval = 1 / args.rate
+            for seq in range(args.messages):
+                await ws.send(
+                    json.dumps(
+                        {
+                            "event": "message",
+                            "chatId": self.chat_id,
+                            "content": (
+                                f"{MESSAGE_PREFIX}:{self.index}:{seq}:"
+                                f"{time.perf_counter()}"
+                            ),
+                        }
+                    )
+                )
+                self.stats["sent"] += 1
+                await asyncio.sleep(interval)
+
+            await asyncio.sleep(args.drain)
+            receiver.cancel()
+
+    async def _receive(self, ws):
+        async for frame in ws:
+            received_at = time.perf_counter()
+            data = json.loads(frame)
+            if data.get("event") == "error":
+                self.stats["errors"] += 1
+                continue
+
+            content = data.get("message") or ""
+            if data.get("event") != "message" or not content.startswith(
+                MESSAGE_PREFIX + ":"
+            ):
+                continue
+
+            _, sender, _, sent_at = content.split(":", 3)
+            lag_ms = (received_at - float(sent_at)) * 1000
+            if int(sender) == self.index:
+                self.stats["echo_ms"].append(lag_ms)
+            else:
+                self.stats["fan_out_ms"].append(lag_ms)
+            self.stats["delivered"] += 1
+
+
+async def http_client(
+    client: httpx.AsyncClient,
+    user_id: int,
+    users_id: List[int],
+    stop: asyncio.Event,
+    stats: dict,
+):
+    headers = auth_headers(user_id)
+    while not stop.is_set():
+        endpoint = random.choice(HTTP_ENDPOINTS)
+        path = endpoint.format(user_id=random.choice(users_id))
+        started_at = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        stats["latency_ms"][endpoint].append(elapsed_ms)
+        if failed:
+            stats["errors"][endpoint] += 1
+
+
+async def run(args: argparse.Namespace) -> dict:
+    seeded = await seed(args)
+    users_id, chats_id = seeded["users_id"], seeded["chats_id"]
+
+    ws_url = args.url.replace("http", "ws", 1) + "/chats/ws"
+    ws_stats = {
+        "sent": 0,
+        "delivered": 0,
+        "errors": 0,
+        "echo_ms": [],
+        "fan_out_ms": [],
+    }
+    clients = [
+        WsClient(
+            index=i,
+            user_id=users_id[i % len(users_id)],
+            chat_id=chats_id[i % len(chats_id)],
+            stats=ws_stats,
+        )
+        for i in range(args.ws_clients)
+    ]
+    start, stop = asyncio.Event(), asyncio.Event()
+    ws_tasks = [
+        asyncio.create_task(client.run(ws_url, args, start))
+        for client in clients
+    ]
+    await asyncio.gather(*(client.ready.wait() for client in clients))
+    for task in ws_tasks:
+        if task.done() and task.exception() is not None:
+            raise task.exception()
+
+    http_stats = {
+        "latency_ms": defaultdict(list),
+        "errors": defaultdict(int),
+    }
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        http_tasks = [
+            asyncio.create_task(
+                http_client(
+                    client,
+                    users_id[i % len(users_id)],
+                    users_id,
+                    stop,
+                    http_stats,
+                )
+            )
+            for i in range(args.http_clients)
+        ]
+
+        started_at = time.perf_counter()
+        start.set()
+        await asyncio.gather(*ws_tasks)
+        stop.set()
+        await asyncio.gather(*http_tasks)
+        elapsed = time.perf_counter() - started_at
+
+    members = defaultdict(int)
+    for client in clients:
+        members[client.chat_id] += 1
+    expected = sum(
+        args.messages * members[client.chat_id] for client in clients
+    )
+    http_latency = [
+        value
+        for values in http_stats["latency_ms"].values()
+        for value in values
+    ]
+
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat(),
+        "config": vars(args),
+        "elapsed_secs": elapsed,
+        "websocket": {
+            "clients": args.ws_clients,
+            "sent": ws_stats["sent"],
+            "delivered": ws_stats["delivered"],
+            "expected": expected,
+            "errors": ws_stats["errors"],
+            "delivered_per_sec": ws_stats["delivered"] / elapsed,
+            "echo_latency_ms": summarize(ws_stats["echo_ms"]),
+            "fan_out_lag_ms": summarize(ws_stats["fan_out_ms"]),
+        },
+        "http": {
+            "clients": args.http_clients,
+            "requests": len(http_latency),
+            "errors": sum(http_stats["errors"].values()),
+            "requests_per_sec": len(http_latency) / elapsed,
+            "latency_ms": summarize(http_latency),
+            "endpoints": {
+                endpoint: {
+                    **summarize(values),
+                    "errors": http_stats["errors"][endpoint],
+                }
+                for endpoint, values in http_stats["latency_ms"].items()
+            },
+        },
+    }
+
+
+def main():
+    args = parse_args()
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import asyncio
 import json
+import os
 import random
 import websockets
 
+# Access token of a participant of chat 1, from POST /api/v1/auths/login
+ACCESS_TOKEN = os.environ["ACCESS_TOKEN"]
+
 USERS_ID = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 TEXT_MESSAGES = [
     {"id": 1, "content": "Hola!"},
@@ -28,10 +32,19 @@ TEXT_MESSAGES = [
 ]
 
 async def test():
-    async with websockets.connect('ws://localhost:8000/api/v1/chats/1') as ws:
+    # websockets 14 renamed extra_headers to additional_headers
+    headers_arg = (
+        'additional_headers'
+        if int(websockets.__version__.split('.')[0]) >= 14
+        else 'extra_headers'
+    )
+    async with websockets.connect(
+        'ws://localhost:8000/api/v1/chats/1',
+        **{headers_arg: {'Authorization': f'Bearer {ACCESS_TOKEN}'}},
+    ) as ws:
         for i, msg in enumerate(TEXT_MESSAGES):
             await ws.send(json.dumps({
-                'userId': random.randint(1, 20),
+                'userId': random.choice(USERS_ID),
                 'content': msg['content']
             }))
             response = await ws.recv()
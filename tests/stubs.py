@@ -0,0 +1,133 @@
+import asyncio
+import json
+from typing import Dict, Set
+
+from fastapi.websockets import WebSocketState
+
+from utils.brokers import RedisBackend
+
+
+class StubWebSocket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(0)
+        self.sent.append(json.loads(message))
+
+    async def close(self, code: int, reason: str):
+        self.closed = (code, reason)
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def _encode(reply) -> bytes:
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(map(_encode, reply))
+
+    data = reply.encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+class RespServer:
+    """In-process stand-in for the Redis PUBLISH/SUBSCRIBE commands."""
+
+    def __init__(self):
+        self.subscriptions: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self.server: asyncio.AbstractServer | None = None
+        self.port = 0
+        self.accepted = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self._handle, "127.0.0.1", 0
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop_clients()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_clients(self):
+        for writer in list(self.subscriptions):
+            writer.close()
+        self.subscriptions.clear()
+
+    def subscribed(self, channel: str) -> int:
+        return sum(
+            channel in channels for channels in self.subscriptions.values()
+        )
+
+    async def _handle(self, reader, writer):
+        self.accepted += 1
+        channels = self.subscriptions[writer] = set()
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+
+                name, args = command[0].upper(), command[1:]
+                if name == "SUBSCRIBE":
+                    for channel in args:
+                        channels.add(channel)
+                        writer.write(
+                            _encode(["subscribe", channel, len(channels)])
+                        )
+                elif name == "UNSUBSCRIBE":
+                    for channel in args:
+                        channels.discard(channel)
+                        writer.write(
+                            _encode(["unsubscribe", channel, len(channels)])
+                        )
+                elif name == "PUBLISH":
+                    channel, message = args
+                    receivers = [
+                        subscriber
+                        for subscriber, joined in self.subscriptions.items()
+                        if channel in joined
+                    ]
+                    for subscriber in receivers:
+                        subscriber.write(
+                            _encode(["message", channel, message])
+                        )
+                    writer.write(_encode(len(receivers)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscriptions.pop(writer, None)
+            writer.close()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+
+async def until(condition, timeout: float = 2):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "Timed out"
+        await asyncio.sleep(0.01)
+
+
+def connected(backend: RedisBackend) -> bool:
+    return all(
+        writer is not None and not writer.is_closing()
+        for writer in (backend.publisher, backend.subscriber)
+    )
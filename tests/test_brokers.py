@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+from utils.brokers import RedisBackend
+from utils.chats import ChatManager
+
+from tests.stubs import RespServer, StubWebSocket, connected, until
+
+
+async def _manager(server: RespServer) -> ChatManager:
+    backend = RedisBackend(url=f"redis://127.0.0.1:{server.port}")
+    backend.RECONNECT_DELAY_SECS = 0.05
+    manager = ChatManager(backend=backend)
+    await manager.startup()
+    await until(lambda: connected(backend))
+    return manager
+
+
+def _frame(message_id: int) -> str:
+    return json.dumps({"event": "message", "id": message_id})
+
+
+def test_redis_backend_across_managers():
+    async def scenario():
+        server = RespServer()
+        await server.start()
+        sender, receiver = await _manager(server), await _manager(server)
+        websocket = StubWebSocket()
+        await receiver.connect(websocket=websocket, chat_id=1, user_id=1)
+        await until(lambda: server.subscribed("chat:1") == 1)
+
+        await sender.broadcast(message=_frame(1), chats_id=[1])
+        await until(lambda: len(websocket.sent) == 1)
+
+        # Reconnected subscribers join their channels again
+        server.drop_clients()
+        await until(lambda: server.accepted == 8)
+        await until(lambda: connected(sender.backend))
+        await until(lambda: server.subscribed("chat:1") == 1)
+        await sender.broadcast(message=_frame(2), chats_id=[1])
+        await until(lambda: len(websocket.sent) == 2)
+
+        # The last local socket leaving unsubscribes the channel
+        await receiver.leave(websocket=websocket, chat_id=1)
+        await until(lambda: server.subscribed("chat:1") == 0)
+        assert server.subscribed("user:1") == 1
+
+        for manager in (sender, receiver):
+            await manager.shutdown()
+        await server.stop()
+        return websocket
+
+    websocket = asyncio.run(scenario())
+
+    assert [frame["id"] for frame in websocket.sent] == [1, 2]
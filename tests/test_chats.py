@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from config.settings import settings
+from utils.chats import ChatManager
+
+from tests.stubs import StubWebSocket
+
+
+def test_replay_longer_than_send_queue():
+    backlog = settings.websockets["send_queue_size"] * 3
+
+    async def scenario():
+        manager = ChatManager()
+        await manager.startup()
+        websocket = StubWebSocket()
+        await manager.connect(
+            websocket=websocket, chat_id=1, user_id=1, paused=True
+        )
+
+        # Live while replaying: one already replayed, one newer
+        for message_id in (backlog, backlog + 1):
+            await manager.broadcast(
+                message=json.dumps({"event": "message", "id": message_id}),
+                chats_id=[1],
+            )
+
+        sent = await manager.send_personal_messages(
+            websocket=websocket,
+            messages=(
+                json.dumps({"event": "message", "id": message_id})
+                for message_id in range(1, backlog + 1)
+            ),
+        )
+        await manager.resume(websocket=websocket, chat_id=1, after_id=backlog)
+        await manager.records[websocket].connection.queue.join()
+        await manager.shutdown()
+        return sent, websocket
+
+    sent, websocket = asyncio.run(scenario())
+
+    assert sent
+    assert websocket.closed is None
+    assert [frame["id"] for frame in websocket.sent] == list(
+        range(1, backlog + 2)
+    )
+
+
+def test_live_message_during_resume_stays_behind_buffer():
+    buffered = settings.websockets["send_queue_size"] + 20
+
+    async def scenario():
+        manager = ChatManager()
+        await manager.startup()
+        websocket = StubWebSocket()
+        await manager.connect(
+            websocket=websocket, chat_id=1, user_id=1, paused=True
+        )
+        for message_id in range(1, buffered + 1):
+            await manager.broadcast(
+                message=json.dumps({"event": "message", "id": message_id}),
+                chats_id=[1],
+            )
+
+        resuming = asyncio.create_task(
+            manager.resume(websocket=websocket, chat_id=1, after_id=0)
+        )
+        # Published once the first chunk is queued and still draining
+        while not websocket.sent:
+            await asyncio.sleep(0)
+        await manager.broadcast(
+            message=json.dumps({"event": "message", "id": buffered + 1}),
+            chats_id=[1],
+        )
+        await resuming
+        await manager.records[websocket].connection.queue.join()
+        await manager.shutdown()
+        return websocket
+
+    websocket = asyncio.run(scenario())
+
+    assert websocket.closed is None
+    assert [frame["id"] for frame in websocket.sent] == list(
+        range(1, buffered + 2)
+    )
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import time
+
+from utils.presences import PresenceService
+
+
+class StubManager:
+    def __init__(self):
+        self.listeners = []
+        self.frames = []
+        self.started_at = time.monotonic()
+
+    async def broadcast(self, message: str, chats_id):
+        elapsed = time.monotonic() - self.started_at
+        self.frames.append((elapsed, json.loads(message)))
+
+
+def test_change_is_not_held_until_typing_expiry():
+    async def scenario():
+        manager = StubManager()
+        presence = PresenceService(
+            manager=manager,
+            debounce_ms=20,
+            min_interval_ms=100,
+            typing_ttl_secs=0.5,
+        )
+        presence.joined(chat_id=1, user_id=1)
+        presence.joined(chat_id=1, user_id=2)
+        await asyncio.sleep(0.05)
+        presence.typing(chat_id=1, user_id=1, typing=True)
+
+        # Flushed, the next timer is the typing expiry of user 1
+        await asyncio.sleep(0.15)
+        presence.typing(chat_id=1, user_id=2, typing=True)
+        presence.joined(chat_id=1, user_id=30)
+        await asyncio.sleep(0.15)
+        await presence.shutdown()
+        return manager.frames
+
+    frames = asyncio.run(scenario())
+
+    elapsed, frame = next(
+        (elapsed, frame) for elapsed, frame in frames if 2 in frame["typing"]
+    )
+    assert frame["online"] == [30]
+    # Due a debounce after the change at 0.2s, not at the expiry at 0.55s
+    assert elapsed < 0.35
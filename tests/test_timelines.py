@@ -0,0 +1,44 @@
+import asyncio
+
+from utils.timelines import TimelineStore
+
+from tests.stubs import RespServer, connected, until
+
+
+async def _store(server: RespServer) -> TimelineStore:
+    store = TimelineStore(
+        max_length=3,
+        max_cached=10,
+        ttl_secs=60,
+        backend_url=f"redis://127.0.0.1:{server.port}",
+    )
+    await store.startup()
+    await until(lambda: connected(store.backend))
+    await until(lambda: store.CHANNEL in store.backend.channels)
+    return store
+
+
+def test_pushes_and_discards_reach_other_workers():
+    async def scenario():
+        server = RespServer()
+        await server.start()
+        writer, reader = await _store(server), await _store(server)
+        await until(lambda: server.subscribed(TimelineStore.CHANNEL) == 2)
+        for store in (writer, reader):
+            store.set(1, [2, 1])
+            store.set(2, [5])
+
+        await writer.push([(3, [1, 2]), (4, [1])])
+        await until(lambda: reader.get(1) == [4, 3, 2])
+        # Older than the head, rebuilt by the next read
+        assert reader.get(2) is None
+        assert writer.get(1) == [4, 3, 2]
+
+        await writer.discard(1)
+        await until(lambda: reader.get(1) is None)
+
+        for store in (writer, reader):
+            await store.shutdown()
+        await server.stop()
+
+    asyncio.run(scenario())